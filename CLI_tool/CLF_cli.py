@@ -24,6 +24,7 @@ from lib.RPC import RPCDevice
 from lib.Centurion import Centurion
 from lib.Configuration import Configuration
 from lib.DeviceCollection import DeviceCollection
+from lib.FPGABroker import PRIORITY_URGENT
 from lib.Radiometer import Radiometer3700, RadiometerOphir
 
 cfg = Configuration()
@@ -139,7 +140,7 @@ class CLF_app(cmd2.Cmd):
 
     @cmd2.with_category("laser command")
     def do_lsr_init(self, args: argparse.Namespace) -> None:
-        self.laser.set_mode(100, 1, 1, 1, 1, 1, dpw = 140, qsdelay = 145)
+        self.laser.apply_profile('lsr_init')
 
     @cmd2.with_category("laser command")
     def do_lsr_fire(self, args: argparse.Namespace) -> None:
@@ -210,18 +211,18 @@ class CLF_app(cmd2.Cmd):
 
     @cmd2.with_category("VXM commands")
     def do_VXM_ECAL_RAD3(self, args: argparse.Namespace) -> None:
-        dc.get_motor("UpNorthSouth").move_ABS(33250)
-        dc.get_motor("UpEastWest").move_ABS(4470)
+        vxm = dc.get_motor("UpNorthSouth").vxm
+        vxm.program().move_abs("UpNorthSouth", 33250).move_abs("UpEastWest", 4470).execute()
     
     @cmd2.with_category("VXM commands")
     def do_VXM_home_UP(self, args: argparse.Namespace) -> None:
-        dc.get_motor("UpNorthSouth").move_ABS0()
-        dc.get_motor("UpEastWest").move_ABS0()
+        vxm = dc.get_motor("UpNorthSouth").vxm
+        vxm.program().move_abs("UpNorthSouth", 0).move_abs("UpEastWest", 0).execute()
     
     @cmd2.with_category("VXM commands")
     def do_VXM_home_LW(self, args: argparse.Namespace) -> None:
-        dc.get_motor("LwNorthSouth").move_ABS0()
-        dc.get_motor("LwPolarizer").move_ABS0()
+        vxm = dc.get_motor("LwNorthSouth").vxm
+        vxm.program().move_abs("LwNorthSouth", 0).move_abs("LwPolarizer", 0).execute()
 
     @cmd2.with_category("VXM commands")
     def do_VXM_move(self, args: argparse.Namespace) -> None:
@@ -230,8 +231,8 @@ class CLF_app(cmd2.Cmd):
     
     @cmd2.with_category("VXM commands")
     def do_VXM_position_rad2(self, args: argparse.Namespace) -> None:
-        dc.get_motor("UpNorthSouth").move_ABS(1300)
-        dc.get_motor("UpEastWest").move_ABS(20200)
+        vxm = dc.get_motor("UpNorthSouth").vxm
+        vxm.program().move_abs("UpNorthSouth", 1300).move_abs("UpEastWest", 20200).execute()
     
     @cmd2.with_category("VXM commands")
     def do_VXM_position_pol(self, args: argparse.Namespace) -> None:
@@ -340,7 +341,7 @@ class CLF_app(cmd2.Cmd):
     @cmd2.with_category("RunControl commands")
     def do_DIS_Laser(self, args: argparse.Namespace) -> None:
         print("Disable Laser Controller... ")
-        dc.fpga.write_dio('laser_en', False)
+        dc.fpga.write_dio('laser_en', False, PRIORITY_URGENT)
         print("done")
     
     @cmd2.with_category("RunControl commands")
@@ -441,7 +442,7 @@ class CLF_app(cmd2.Cmd):
     
     @cmd2.with_category("RunControl commands")
     def do_stop_FIRE(self, args: argparse.Namespace) -> None:
-        dc.fpga.write_dio('laser_en', 0)
+        dc.fpga.write_dio('laser_en', 0, PRIORITY_URGENT)
 
         
 
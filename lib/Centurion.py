@@ -1,6 +1,8 @@
+import math
 import serial
 import time
 import logging
+import multiprocessing
 import datetime
 from functools import partial
 from logging.handlers import TimedRotatingFileHandler
@@ -13,6 +15,22 @@ CENTURION_BAUD = 57600
 
 QFREQ = 1             #Rate at which Q-switch is fired relative to doide rate (Default) */
 BUFSIZE = 255         #input, output buffer size */
+CENTURION_REPLY_TIMEOUT = 1.0     # deadline for the echo of a command (s)
+CENTURION_POLL_TIMEOUT = 0.05     # serial timeout while waiting for a reply (s)
+CENTURION_LATENCY_BINS = [0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1]    # upper edges (s)
+# parameters kept by the laser until it is powered off
+CENTURION_PARAMETERS = ['$DFREQ', '$DIODE', '$QSON', '$QSWIT', '$DTRIG', '$QSTRI', '$DPW', '$QSDEL']
+# read back to confirm the session snapshot, the laser powers up with the diodes disabled
+CENTURION_READBACK = '$DIODE'
+# head, dump and plate temperature limits for firing
+CENTURION_TEMP_LIMITS = (500, 450, 450)
+# named set_mode configurations
+CENTURION_PROFILES = {
+    'fd': {'qson': 1, 'dpw': 140},
+    'raman': {'qson': 1, 'dpw': 140},
+    'tank': {'qson': 1, 'dpw': 140},
+    'lsr_init': {'freq': 100, 'diode': 1, 'qson': 1, 'qswitch': 1, 'dtrig': 1, 'qstrig': 1, 'dpw': 140, 'qsdelay': 145},
+}
 
 class Centurion:
 
@@ -37,6 +55,16 @@ class Centurion:
         self.dump_temp = -99
         self.plate_temp = -99 
 
+        # per command name: [count, sum, max, timeouts, histogram]
+        self.latency = {}
+        # last known value of CENTURION_PARAMETERS in this power-on session (NaN
+        # unknown) and skipped/sent counters, shared with the forked run processes
+        self.session = multiprocessing.Array('d', [math.nan] * len(CENTURION_PARAMETERS))
+        self.session_counters = multiprocessing.Array('l', 2)
+        # one exchange at a time on the serial line: the telemetry poller and
+        # the forked run processes share it
+        self.lock = multiprocessing.Lock()
+
         try:
             self.serial = serial.Serial(**self.params)
         except serial.SerialException as e:
@@ -77,24 +105,170 @@ class Centurion:
             self.log(logging.INFO, f"CENT:READ_R:ERROR:Unable to read response")
             return -1
 
+    @staticmethod
+    def command_name(line):
+        # replies echo the command, compared on the 5 letter mnemonic ($STANDBY -> $STAND)
+        parts = line.split()
+        return parts[0][:6].upper() if parts else ''
+
     @check_open
-    def send_command(self, command):
+    def send_command(self, command, timeout=CENTURION_REPLY_TIMEOUT):
+        # returns the reply line as soon as its terminator arrives: lines not
+        # echoing the command (late replies, noise) are skipped, "" if no
+        # reply before the timeout
+        replies = self.pipeline([command], timeout)
+        return replies if replies == -1 else replies[0]
+
+    @check_open
+    def pipeline(self, commands, timeout=CENTURION_REPLY_TIMEOUT):
+        # writes all the commands at once and matches the replies on the echoed
+        # command name, in order for repeated names; "" for the commands not
+        # answered before the timeout, -1 on a serial error
+        commands = [command.strip() for command in commands]
+        names = [Centurion.command_name(command) for command in commands]
+        replies = [None] * len(commands)
+        with self.lock:
+            saved = self.serial.timeout
+            try:
+                self.serial.timeout = CENTURION_POLL_TIMEOUT
+                self.serial.write("".join(f"{command}\r" for command in commands).encode())
+                t = time.monotonic()
+                while None in replies and time.monotonic() - t < timeout:
+                    line = self.serial.read_until(b'\r').decode(errors='ignore').strip()
+                    if not line:
+                        continue
+                    name = Centurion.command_name(line)
+                    i = next((i for i, n in enumerate(names) if n == name and replies[i] is None), None)
+                    if i is None:
+                        self.log(logging.INFO, f"CENT:SEND_COMM:Skipping reply {line} to {commands}")
+                        continue
+                    self.record_latency(name, time.monotonic() - t)
+                    self.log(logging.INFO, line)
+                    self.observe(line)
+                    replies[i] = line
+                for i, command in enumerate(commands):
+                    if replies[i] is None:
+                        self.record_latency(names[i], None)
+                        self.log(logging.INFO, f"CENT:SEND_COMM:ERROR:No reply to {command} in {timeout} s")
+                        replies[i] = ""
+                return replies
+            except serial.SerialException as e:
+                self.log(logging.INFO, f"CENT:SEND_COMM:Unable to send {commands} command: {e}")
+                return -1
+            finally:
+                self.serial.timeout = saved
+
+    @staticmethod
+    def parameter(name):
+        name = Centurion.command_name(name)
+        return CENTURION_PARAMETERS.index(name) if name in CENTURION_PARAMETERS else None
+
+    def observe(self, line):
+        # every set or query reply echoes the value now held by the laser
+        parts = line.split()
+        idx = Centurion.parameter(parts[0])
+        if idx is None or len(parts) != 2:
+            return
         try:
-            self.serial.flush()
-            self.serial.write(f"{command}\r".encode())
-            time.sleep(0.5)
-            response = self.read_response()
-            return response
-        except serial.SerialException as e:
-            self.log(logging.INFO, f"CENT:SEND_COMM:Unable to send {command} command: {e}")
+            value = float(parts[1])
+        except ValueError:
+            return
+        with self.session.get_lock():
+            self.session[idx] = value
+
+    def invalidate(self, *args):
+        # laser outlet power cycled, the parameters are lost
+        with self.session.get_lock():
+            for i in range(len(self.session)):
+                self.session[i] = math.nan
+
+    def parameters(self):
+        with self.session.get_lock():
+            return {name: None if math.isnan(value) else value for name, value in zip(CENTURION_PARAMETERS, self.session)}
+
+    def session_stats(self):
+        return {'skipped': self.session_counters[0], 'sent': self.session_counters[1]}
+
+    def load_parameters(self):
+        # one bulk query of the whole parameter set
+        self.flush_buffers()
+        replies = self.pipeline([f"{name} ?" for name in CENTURION_PARAMETERS])
+        if replies == -1:
             return -1
+        return 0 if all(replies) else -1
+
+    def configure(self, settings):
+        # writes the settings not already held by the laser, the session
+        # snapshot is loaded first if incomplete, otherwise one cached setting
+        # is read back with the writes: a power cut or reset not seen by this
+        # process drops the snapshot. Returns the failed settings
+        known = self.parameters()
+        loaded = any(known[Centurion.command_name(name)] is None for name in settings)
+        if loaded:
+            self.load_parameters()
+            known = self.parameters()
+        changed = {name: value for name, value in settings.items()
+            if known[Centurion.command_name(name)] != float(value)}
+        cached = [name for name in settings if name not in changed]
+        if CENTURION_READBACK in cached:
+            cached.insert(0, cached.pop(cached.index(CENTURION_READBACK)))
+        check = [f"{cached[0]} ?"] if cached and not loaded else []
+        if not check and not changed:
+            return []
+        self.flush_buffers()
+        replies = self.pipeline(check + [f"{name} {value}" for name, value in changed.items()])
+        if replies == -1:
+            return list(changed)
+
+        if check:
+            parts = replies[0].split()
+            try:
+                confirmed = len(parts) == 2 and float(parts[1]) == float(settings[cached[0]])
+            except ValueError:
+                confirmed = False
+            if not confirmed:
+                self.log(logging.INFO, f"CENT:CONFIGURE:{cached[0]} read back as {replies[0]}, parameters lost")
+                self.invalidate()
+                return self.configure(settings)
+            replies = replies[1:]
+
+        with self.session.get_lock():
+            self.session_counters[0] += len(cached)
+            self.session_counters[1] += len(changed)
+        failed = []
+        for (name, value), reply in zip(changed.items(), replies):
+            parts = reply.split()
+            if len(parts) == 2 and parts[1] == f"{value}":
+                self.log(logging.INFO, f"CENT:PARAMETER_SET:Parameter {parts[0]}, value set: {parts[1]}")
+            else:
+                self.log(logging.INFO, f"CENT:PARAMETER_SET:ERROR:Unable to set parameter {name}: {reply}")
+                failed.append(name)
+        return failed
+
+    def record_latency(self, name, dt):
+        entry = self.latency.setdefault(name, [0, 0.0, 0.0, 0, [0] * (len(CENTURION_LATENCY_BINS) + 1)])
+        if dt is None:
+            entry[3] += 1
+            return
+        i = 0
+        while i < len(CENTURION_LATENCY_BINS) and dt > CENTURION_LATENCY_BINS[i]:
+            i += 1
+        entry[4][i] += 1
+        entry[0] += 1
+        entry[1] += dt
+        entry[2] = max(entry[2], dt)
+
+    def latency_stats(self):
+        labels = [f"<={edge}s" for edge in CENTURION_LATENCY_BINS] + [f">{CENTURION_LATENCY_BINS[-1]}s"]
+        return {name: {'count': n, 'mean': total / n if n else 0.0, 'max': dtmax, 'timeouts': timeouts,
+            'hist': dict(zip(labels, hist))} for name, (n, total, dtmax, timeouts, hist) in self.latency.items()}
         
     @check_open
     def flush_buffers(self):
         try:
-            self.serial.reset_input_buffer()
-            self.serial.reset_output_buffer()
-            time.sleep(0.1)
+            with self.lock:
+                self.serial.reset_input_buffer()
+                self.serial.reset_output_buffer()
             return 0
         except Exception as e:
             self.log(logging.INFO, f"CENT:FLUSH_BUFFERS:Unable to flush buffers")
@@ -102,8 +276,7 @@ class Centurion:
 
     def comm_test(self):
         self.flush_buffers()
-        time.sleep(0.1)
-        command = "$HVERS ?\r"
+        command = "$HVERS ?"
         response = self.send_command(command)
         #response = self.read_response()
         self.log(logging.INFO, f"CENT:COMM_TEST:received:{response}")
@@ -142,30 +315,46 @@ class Centurion:
             self.log(logging.INFO, "CENT:SET_MODE:Setting up Centurion Laser...")
             self.log(logging.INFO, "CENT:SET_MODE:Going Standby...")
             self.send_command("$STANDBY")
-            
-            for _ in range(3):
+
+            settings = {
                 #setting frequency (100 == 2Hz)
-                self.set_parameter("$DFREQ", freq)
+                "$DFREQ": freq,
                 #setting diodes (off = 0, enabled = 1) 
-                self.set_parameter("$DIODE", diode)
+                "$DIODE": diode,
                 #setting Q-switch (off = 0, enabled = 1)
-                self.set_parameter("$QSON", qson)
+                "$QSON": qson,
                 #setting laser to be Q-switched (long pulse = 0, Q-switched = 1)
-                self.set_parameter("$QSWIT", qswitch)
+                "$QSWIT": qswitch,
                 #setting diode trigger in external mode (internal = 0, external = 1)
-                self.set_parameter("$DTRIG", dtrig)
+                "$DTRIG": dtrig,
                 #setting Q-swicth trigger to external mode (internal = 0, external = 1)
-                self.set_parameter("$QSTRI", qstrig)
+                "$QSTRI": qstrig,
                 #setting diodes pulse (energy of the laser)
-                self.set_parameter("$DPW", dpw)
+                "$DPW": dpw,
                 #setting delay for Q-switch (relevant only for internal trigger)
-                self.set_parameter("$QSDEL", qsdelay)
-                if self.status() == 0x7E:
+                "$QSDEL": qsdelay,
+            }
+            for _ in range(3):
+                # only the parameters differing from the session snapshot are written
+                failed = self.configure(settings)
+                if not failed and self.status() == 0x7E:
                     self.log(logging.INFO, "set up complete")
                     return 0
+                if failed:
+                    # read the whole set again before retrying
+                    self.invalidate()
+            self.log(logging.INFO, f"CENT:SET_MODE:ERROR:Unable to set up the laser, failed: {failed}")
+            return -1
         except Exception as e:
             self.log(logging.INFO, f"CENT:SET_MODE:ERROR:Some problem occurred:{e}")
             return -1 
+
+    def apply_profile(self, name):
+        if name not in CENTURION_PROFILES:
+            self.log(logging.INFO, f"CENT:APPLY_PROFILE:ERROR:Unknown profile {name}")
+            return -1
+        self.log(logging.INFO, f"CENT:APPLY_PROFILE:{name}")
+        return self.set_mode(**CENTURION_PROFILES[name])
         
     def check_mode(self):
         self.flush_buffers()
@@ -347,16 +536,23 @@ class Centurion:
         self.flush_buffers()
         self.set_parameter("$DPW", pwd)
 
-    def fire(self):
+    @staticmethod
+    def temps_ok(temps):
+        return temps is not None and all(t <= limit for t, limit in zip(temps, CENTURION_TEMP_LIMITS))
+
+    def fire(self, temps=None):
+        # temps: fresh (head, dump, plate) from the telemetry, read here if not given
         self.flush_buffers()
-        status = self.read_status()
+        if temps is None:
+            status = self.read_status()
 
-        #while self.state != "7e":
-        #    self.send_command("$STAND")
-        #    status = self.read_status()
+            #while self.state != "7e":
+            #    self.send_command("$STAND")
+            #    status = self.read_status()
 
-        self.check_temps()
-        if self.head_temp <= 500 and self.dump_temp <= 450 and self.plate_temp <= 450:
+            self.check_temps()
+            temps = (self.head_temp, self.dump_temp, self.plate_temp)
+        if Centurion.temps_ok(temps):
             self.send_command("$FIRE")
            
 
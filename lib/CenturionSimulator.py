@@ -0,0 +1,179 @@
+import os
+import sys
+import math
+import time
+import argparse
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.PtySimulator import PtySimulator
+from lib.Centurion import Centurion, CENTURION_PARAMETERS, CENTURION_TEMP_LIMITS
+
+# status byte: asleep, warming up or inhibited, fire authorized, firing
+CENTSIM_SLEEP = 0x00
+CENTSIM_WARMING = 0x3E
+CENTSIM_READY = 0x7E
+CENTSIM_FIRING = 0xFE
+# parameters at power on
+CENTSIM_DEFAULTS = {'$DFREQ': '100', '$DIODE': '0', '$QSON': '0', '$QSWIT': '1',
+    '$DTRIG': '0', '$QSTRI': '0', '$DPW': '100', '$QSDEL': '145'}
+CENTSIM_AMBIENT = 250                   # 0.1 degC
+# head, dump, plate: equilibrium rise per unit of diode duty (0.1 degC per Hz*ms) and time constant (s)
+CENTSIM_GAIN = (12.0, 10.0, 6.0)
+CENTSIM_TAU = (60.0, 90.0, 300.0)
+
+class CenturionSimulator(PtySimulator):
+
+    # Centurion laser stand-in answering the commands sent by lib/Centurion.py:
+    # parameters echo their value on set and query, $STATUS reports the state
+    # byte (CENTSIM_*) and four zero bytes, $TEMPS the head, dump and plate
+    # temperatures in 0.1 degC. Fire authorization needs the diodes enabled for
+    # `warmup` seconds and every temperature within CENTURION_TEMP_LIMITS. While
+    # firing each temperature relaxes toward ambient + gain * duty (shot rate *
+    # $DPW), in standby back toward ambient. Shots come from an FPGASimulator
+    # (shots_cnt) when given, otherwise at `rate` or $DFREQ / 50 Hz. Time runs
+    # `speedup` times faster than the wall clock
+
+    def __init__(self, link=None, speedup=1.0, warmup=60.0, rate=None, fpga=None, reply_delay=0.002):
+        super().__init__(link=link, terminator=b'\r')
+        self.speedup = speedup
+        self.warmup = warmup
+        self.rate = rate
+        self.fpga = fpga
+        self.reply_delay = reply_delay
+        self.mutex = threading.Lock()
+        self.counters = {'commands': 0, 'errors': 0}
+        self.temps = [float(CENTSIM_AMBIENT)] * 3
+        self.shots = 1000000
+        self.user_shots = 0
+        self.power_cycle()
+
+    def power_cycle(self):
+        # parameters and warmup lost, the head keeps its temperature
+        with self.mutex:
+            self.params = dict(CENTSIM_DEFAULTS)
+            self.mode = 'standby'
+            self.warm = 0.0
+            self.residual = 0.0
+            self.last = time.monotonic()
+            self.last_cnt = self.fpga.get_register('shots_cnt') if self.fpga is not None else None
+
+    def stats(self):
+        with self.mutex:
+            self.update()
+            return dict(self.counters, shots=self.user_shots, warm=round(self.warm, 1),
+                temps=[int(round(t)) for t in self.temps], status=f"{self.status():#04x}")
+
+    def shot_rate(self):
+        if self.rate is not None:
+            return self.rate
+        return float(self.params['$DFREQ']) / 50
+
+    def authorized(self):
+        return (self.mode != 'sleep' and self.params['$DIODE'] == '1' and self.warm >= self.warmup
+            and all(t <= limit for t, limit in zip(self.temps, CENTURION_TEMP_LIMITS)))
+
+    def status(self):
+        if self.mode == 'sleep':
+            return CENTSIM_SLEEP
+        if not self.authorized():
+            return CENTSIM_WARMING
+        return CENTSIM_FIRING if self.mode == 'fire' else CENTSIM_READY
+
+    def update(self):
+        # advance the simulated clock to now, under self.mutex
+        now = time.monotonic()
+        dt = (now - self.last) * self.speedup
+        self.last = now
+        if self.mode == 'fire' and not self.authorized():
+            # interlock: overheating stops the emission
+            self.mode = 'standby'
+
+        if self.fpga is not None:
+            cnt = self.fpga.get_register('shots_cnt')
+            fired = (cnt - self.last_cnt) & 0xFFFFFFFF if self.mode == 'fire' else 0
+            self.last_cnt = cnt
+            rate = fired / dt if dt > 0 else 0.0
+        elif self.mode == 'fire':
+            self.residual += self.shot_rate() * dt
+            fired = int(self.residual)
+            self.residual -= fired
+            rate = self.shot_rate()
+        else:
+            fired, rate = 0, 0.0
+        self.shots += fired
+        self.user_shots += fired
+
+        duty = rate * float(self.params['$DPW']) / 1000
+        for i in range(3):
+            target = CENTSIM_AMBIENT + CENTSIM_GAIN[i] * duty
+            self.temps[i] = target + (self.temps[i] - target) * math.exp(-dt / CENTSIM_TAU[i])
+        if self.mode != 'sleep' and self.params['$DIODE'] == '1':
+            self.warm += dt
+
+    def handle(self, line):
+        if not line:
+            return
+        self.counters['commands'] += 1
+        time.sleep(self.reply_delay)
+        parts = line.split()
+        name = Centurion.command_name(parts[0])
+        with self.mutex:
+            self.update()
+            reply = self.execute(parts, name)
+        if reply is None:
+            self.counters['errors'] += 1
+            reply = "?"
+        self.write(f"{reply}\r")
+
+    def execute(self, parts, name):
+        query = len(parts) == 2 and parts[1] == '?'
+        if name in CENTURION_PARAMETERS and len(parts) == 2:
+            if not query:
+                if not parts[1].lstrip('-').isdigit():
+                    return None
+                self.params[name] = parts[1]
+                if name == '$DIODE' and parts[1] != '1':
+                    self.warm = 0.0
+            return f"{parts[0]} {self.params[name]}"
+        if name == '$STATU' and query:
+            return f"{parts[0]} {self.status():02X} 00 00 00 00"
+        if name == '$TEMPS' and query:
+            return f"{parts[0]} " + " ".join(str(int(round(t))) for t in self.temps)
+        if name == '$HVERS' and query:
+            return f"{parts[0]} CENTURION-SIM 1.0"
+        if name == '$SHOT' and query:
+            return f"{parts[0]} {self.shots}"
+        if name == '$USHOT' and len(parts) == 2:
+            if not query:
+                self.user_shots = int(parts[1]) if parts[1].isdigit() else self.user_shots
+            return f"{parts[0]} {self.user_shots}"
+        if name == '$STAND':
+            self.mode = 'standby'
+            return parts[0]
+        if name == '$FIRE':
+            if self.authorized():
+                self.mode = 'fire'
+            return parts[0]
+        if name == '$STOP':
+            self.mode = 'sleep'
+            self.warm = 0.0
+            return parts[0]
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Centurion laser simulator')
+    parser.add_argument('--link', default=None, help='symlink for the pty (e.g. /tmp/ttyr01)')
+    parser.add_argument('--speedup', type=float, default=1.0, help='time compression factor')
+    parser.add_argument('--warmup', type=float, default=60.0, help='diode warmup before fire authorization (s)')
+    parser.add_argument('--rate', type=float, default=None, help='shot rate while firing (Hz), $DFREQ / 50 by default')
+    args = parser.parse_args()
+
+    sim = CenturionSimulator(args.link, args.speedup, args.warmup, args.rate).start()
+    print(f"Centurion: {sim.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
+        print(sim.stats())
@@ -1,23 +1,32 @@
 import os
 import sys
 import serial
+import threading
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
 from lib.RPC import RPCDevice
 from lib.VXM import VXM
+from lib.PositionTracker import PositionTracker
+from lib.MotorPlanner import MotorPlanner
 from lib.Radiometer import Radiometer3700, RadiometerOphir
 from lib.Centurion import Centurion
+from lib.LaserTelemetry import LaserTelemetry, TELEMETRY_PERIOD
+from lib.ShotCorrelator import CORR_LATENCY_ERROR
 from lib.FPGADevice import FPGADevice
 from lib.FPGAData import FPGAData
 
 class DeviceCollection:
-    def __init__(self):
+    def __init__(self, fpga_port="/dev/runcontrol", laser_port="/dev/ttyr01", data_port="/dev/data0"):
         self.serials = {}
         self.outlets = {}
         self.motors = {}
         self.radiometers = {}
-        self.fpga = FPGADevice("/dev/runcontrol")
-        self.laser = Centurion("/dev/ttyr01")
-        self.data = FPGAData("/dev/data0")
+        # calibrated reporting latency of the radiometers, {name: (nominal, error)} (s)
+        self.latency = {}
+        self.positions = None
+        self.telemetry = None
+        self.fpga = FPGADevice(fpga_port)
+        self.laser = Centurion(laser_port)
+        self.data = FPGAData(data_port)
 
     def init(self, cfg):
         # outlets
@@ -30,10 +39,32 @@ class DeviceCollection:
             port_params = cfg.get_port_params(mparams['port'])
             self.add_motor(mparams['id'], mname, **port_params)
 
+        # motor positions survive across runs until the VXM outlet is cycled
+        self.positions = PositionTracker(f"conf/{str.lower(cfg.parameters['identity'])}/positions.yml")
+        for vxm in self.serials.values():
+            if isinstance(vxm, VXM):
+                vxm.tracker = self.positions
+        if 'VXM' in self.outlets:
+            self.outlets['VXM'].add_listener(lambda state: self.positions.invalidate())
+
         # radiometers 
         for rname, rparams in cfg.radiometers.items():
             port_params = cfg.get_port_params(rparams['port'])
             self.add_radiometer(rname, rparams['model'], **port_params)
+            if 'latency' in rparams:
+                self.latency[rname] = (rparams['latency'], rparams.get('latency_error', CORR_LATENCY_ERROR))
+
+        # radiometers lose their configuration when the outlet is power cycled
+        if 'radiometer' in self.outlets:
+            self.outlets['radiometer'].add_listener(self.invalidate_radiometers)
+
+        # laser telemetry, sampled by the main process, read by the runs
+        self.telemetry = LaserTelemetry(self.laser, cfg.parameters.get('laser_telemetry_period', TELEMETRY_PERIOD))
+
+        # the laser loses its parameters too, and has no telemetry while off
+        if 'laser' in self.outlets:
+            self.outlets['laser'].add_listener(self.laser.invalidate)
+            self.outlets['laser'].add_listener(self.telemetry.power)
 
     def add_outlet(self, id, name, port, baudrate=115200, bytesize=8, parity='N', stopbits=1, timeout=1):
         if(self.serials.get(port, None) == None):
@@ -63,6 +94,9 @@ class DeviceCollection:
     def get_motor(self, name):
         return self.motors[name]
 
+    def get_planner(self):
+        return MotorPlanner(self.motors)
+
     def add_radiometer(self, name, model, port, baudrate=115200, bytesize=8, parity='N', stopbits=1, timeout=1):
         if(self.serials.get(port, None) == None):
             params = locals()
@@ -79,5 +113,27 @@ class DeviceCollection:
     def get_radiometer(self, name):
         return self.radiometers[name]
 
+    def get_radiometers(self):
+        # one entry per serial port
+        ret = {}
+        for name, rad in self.radiometers.items():
+            if rad not in ret.values():
+                ret[name] = rad
+        return ret
+
+    def invalidate_radiometers(self, state=None):
+        for rad in self.get_radiometers().values():
+            rad.invalidate()
+
+    def setup_radiometers(self):
+        # setup of all the configured radiometers in parallel, one thread per port
+        radiometers = self.get_radiometers()
+        threads = [threading.Thread(target=rad.setup) for rad in radiometers.values()]
+        for thr in threads:
+            thr.start()
+        for thr in threads:
+            thr.join()
+        return {name: rad for name, rad in radiometers.items() if rad.is_ready()}
+
     def __repr__(self):
         return f'{self.outlets}'
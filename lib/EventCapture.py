@@ -0,0 +1,123 @@
+import time
+import threading
+import numpy as np
+from lib.Radiometer import RadiometerReader
+from lib.ShotCorrelator import ShotCorrelator
+
+CAPTURE_INTERVAL = 0.05             # data port drain period (s), 5 shots at 100 Hz
+CAPTURE_METRICS_INTERVAL = 10       # live metrics period (s)
+
+class EventCapture:
+
+    # streams every FPGA event packet to a ShotArchive at Raman rates: the data
+    # port is drained periodically into the fixed FPGAData ring buffer, decoded
+    # in batch and copied into the memory-mapped columns, so memory stays bounded
+    # and writes never wait for the disk. Radiometer samples, when available,
+    # are kept aside and correlated with the shots in bulk at the end, using
+    # their calibrated latency {name: (nominal, error)}
+
+    def __init__(self, data, archive, pulse_period, radiometers=None, timing=None, interval=CAPTURE_INTERVAL, log=None,
+            latency=None):
+        self.data = data
+        self.archive = archive
+        self.timing = timing
+        self.pulse_period = pulse_period
+        self.latency = latency or {}
+        self.interval = interval
+        self.log = log
+        self.stopped = threading.Event()
+        self.thr = None
+        radiometers = radiometers or {}
+
+        self.readers = {name: RadiometerReader(rad) for name, rad in radiometers.items()}
+        self.samples = {name: (np.full(archive.capacity, np.nan), np.full(archive.capacity, np.nan))
+            for name in radiometers}
+        self.nsamples = {name: 0 for name in radiometers}
+
+        self.last_pulses = None
+        self.last_shot = -1
+        self.captured = 0
+        self.rate = 0.0
+
+    def start(self):
+        self.data.reset()
+        self.stopped.clear()
+        for reader in self.readers.values():
+            reader.start()
+        self.thr = threading.Thread(target=self.loop, daemon=True)
+        self.thr.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thr is not None:
+            self.thr.join()
+        for reader in self.readers.values():
+            reader.stop()
+        self.drain_samples()
+        self.correlate()
+
+    def loop(self):
+        t_metrics = time.monotonic()
+        n_metrics = 0
+        while not self.stopped.wait(self.interval):
+            self.drain()
+            self.drain_samples()
+            now = time.monotonic()
+            if now - t_metrics >= CAPTURE_METRICS_INTERVAL:
+                self.rate = (self.captured - n_metrics) / (now - t_metrics)
+                t_metrics, n_metrics = now, self.captured
+                if self.log is not None:
+                    self.log(self.stats())
+        self.drain()
+
+    def drain(self):
+        host_time = time.time()
+        seconds, counter, pps_delta, pulses = self.data.read_batch()
+        n = len(pulses)
+        if n == 0:
+            return
+        # unwrap the 16-bit counter_pulses into the shot index
+        if self.last_pulses is None:
+            self.last_pulses, self.last_shot = int(pulses[0]) - 1, int(pulses[0]) - 2
+        shot = self.last_shot + np.cumsum(np.diff(pulses, prepend=self.last_pulses) & 0xFFFF)
+        self.last_pulses = int(pulses[-1])
+        self.last_shot = int(shot[-1])
+
+        self.archive.extend(shot=shot, seconds=seconds, counter=counter, pps_delta=pps_delta,
+            counter_pulses=pulses, host_time=host_time)
+        self.captured += n
+        if self.timing is not None:
+            self.timing.update(counter, pps_delta)
+
+    def drain_samples(self):
+        for name, reader in self.readers.items():
+            rx, values = self.samples[name]
+            samples = reader.drain()[:len(rx) - self.nsamples[name]]
+            i, n = self.nsamples[name], len(samples)
+            rx[i:i + n], values[i:i + n] = samples[:, 1], samples[:, 2]
+            self.nsamples[name] += n
+
+    def correlate(self):
+        if not self.readers or self.archive.count == 0:
+            return
+        n = self.archive.count
+        columns = {name: self.archive.arrays[name][:n] for name in ['host_time', 'seconds', 'counter']}
+        ambiguous = []
+        for name, (rx, values) in self.samples.items():
+            m = self.nsamples[name]
+            latency = {column: self.latency[name] for column in ['energy', 'rxtime'] if name in self.latency}
+            ret = ShotCorrelator.correlate(self.pulse_period, columns['host_time'], columns['seconds'],
+                columns['counter'], {'energy': (rx[:m], values[:m]), 'rxtime': (rx[:m], rx[:m])}, latency=latency)
+            self.archive.set_column(f"energy_{name}", ret['energy'])
+            self.archive.set_column(f"rxtime_{name}", ret['rxtime'])
+            if ret['ambiguous']:
+                ambiguous.append(name)
+        self.archive.set_meta('ambiguous', ambiguous)
+
+    def stats(self):
+        ret = {'captured': self.captured, 'rate': round(self.rate, 1)}
+        ret.update(self.data.stats())
+        for name, reader in self.readers.items():
+            ret[name] = reader.stats()
+        return ret
@@ -0,0 +1,262 @@
+import os
+import sys
+import time
+import queue
+import serial
+import argparse
+import itertools
+import threading
+import subprocess
+from multiprocessing.connection import Listener
+
+FPGA_BURST = 16             # max commands queued on the UART before collecting replies
+FPGA_WRITE_SETTLE = 0.1     # settle time after a write burst (s)
+FPGA_REGMAP_SIZE = 0x40     # size of the shadow register map (16-bit words)
+FPGA_READ_RETRIES = 3       # attempts of a read burst chunk with missing or garbled replies
+FPGA_RESYNC_QUIET = 0.05    # silence on the UART that ends a resync (s)
+FPGA_BROKER_AUTHKEY = b'runcontrol'
+
+# request priorities, lower value is served first
+PRIORITY_URGENT = 0         # safety writes (abort, laser_en=0)
+PRIORITY_NORMAL = 1         # run and CLI requests
+PRIORITY_LOW = 2            # housekeeping polls
+
+# single owner of the runcontrol serial port: FPGADevice clients send register
+# and DIO requests over a unix socket, pending requests are served by priority
+# and consecutive reads are merged in one pipelined burst. The broker runs as
+# its own detached program and serves every client until a 'close' request
+class FPGABroker:
+
+    def __init__(self, port, baudrate, cached_addrs):
+        self.port = port
+        self.baudrate = baudrate
+        self.address = FPGABroker.get_address(port)
+        self.cached_addrs = set(cached_addrs)
+
+    @staticmethod
+    def get_address(port):
+        return f"/tmp/fpga{port.replace('/', '_')}.sock"
+
+    @staticmethod
+    def spawn(port, baudrate, cached_addrs):
+        # start the broker in its own session, not as a child tied to the
+        # caller, so it outlives the program that started it; returns once it
+        # listens, the status line is the only output it sends back
+        proc = subprocess.Popen([sys.executable, os.path.realpath(__file__), port, '--baudrate', str(baudrate),
+            '--cached', ','.join(str(addr) for addr in sorted(cached_addrs))],
+            stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, start_new_session=True)
+        status = proc.stdout.readline().decode().strip()
+        proc.stdout.close()
+        if status != 'ok':
+            raise RuntimeError(status or f"Class FPGABroker - broker for {port} exited")
+        return proc
+
+    def ready(self, status):
+        print(status, flush=True)
+        # detach from the pipe of the spawning program
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        os.close(devnull)
+
+    def run(self):
+        try:
+            self.serial = serial.Serial(self.port, self.baudrate, timeout = 2)
+        except serial.SerialException as e:
+            self.ready(f"Class FPGABroker - unable to open {self.port}: {e}")
+            return
+
+        if os.path.exists(self.address):
+            os.unlink(self.address)
+        self.listener = Listener(self.address, family='AF_UNIX', authkey=FPGA_BROKER_AUTHKEY)
+
+        self.shadow = [-1] * FPGA_REGMAP_SIZE
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        self.requests = queue.Queue()
+        self.seq = itertools.count()
+        self.stopped = threading.Event()
+
+        threading.Thread(target=self.accept, daemon=True).start()
+        threading.Thread(target=self.serve, daemon=True).start()
+        self.ready('ok')
+
+        self.stopped.wait()
+        self.serial.close()
+        self.listener.close()
+
+    def accept(self):
+        while not self.stopped.is_set():
+            try:
+                conn = self.listener.accept()
+            except ConnectionError:
+                # client gone during the handshake
+                continue
+            except OSError:
+                # listener closed
+                break
+            except Exception:
+                # failed authentication
+                continue
+            threading.Thread(target=self.client, args=(conn,), daemon=True).start()
+
+    def client(self, conn):
+        while True:
+            try:
+                op, priority, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            self.requests.put((priority, next(self.seq), op, payload, conn))
+        conn.close()
+
+    def serve(self):
+        pending = []
+        while not self.stopped.is_set():
+            if not pending:
+                pending.append(self.requests.get())
+            while True:
+                try:
+                    pending.append(self.requests.get_nowait())
+                except queue.Empty:
+                    break
+            pending.sort(key=lambda r: r[:2])
+
+            # merge all the reads at the head of the queue in one burst
+            n = 1
+            if pending[0][2] == 'read':
+                while n < len(pending) and pending[n][2] == 'read':
+                    n += 1
+            batch, pending = pending[:n], pending[n:]
+
+            try:
+                if batch[0][2] == 'read':
+                    values = self.read_addresses([addr for r in batch for addr in r[3]])
+                    for r in batch:
+                        failed = [hex(addr) for addr, value in zip(r[3], values) if value is None]
+                        if failed:
+                            self.reply(r[4], False, f"read request failed at {failed}")
+                        else:
+                            self.reply(r[4], True, values[:len(r[3])])
+                        values = values[len(r[3]):]
+                    continue
+                _, _, op, payload, conn = batch[0]
+                self.reply(conn, True, self.execute(op, payload))
+                if op == 'close':
+                    # stop only once the client got its reply
+                    self.stopped.set()
+            except Exception as e:
+                for r in batch:
+                    self.reply(r[4], False, f"{r[2]} request failed: {e}")
+
+    def execute(self, op, payload):
+        if op == 'write':
+            return self.write_addresses(*payload)
+        elif op == 'dio':
+            addr, bit, b = payload
+            value = self.read_addresses([addr])[0]
+            if value is None:
+                raise IOError(f"no reply from {hex(addr)}")
+            if b:
+                value = value | (1 << bit)
+            else:
+                value = value & ~(1 << bit)
+            return self.write_addresses([(addr, value)], verify=False)
+        elif op == 'invalidate':
+            self.shadow = [-1] * FPGA_REGMAP_SIZE
+        elif op == 'stats':
+            return {'hits': self.cache_hits, 'misses': self.cache_misses}
+        elif op == 'close':
+            pass
+        else:
+            raise NameError(op)
+
+    def reply(self, conn, ok, value):
+        try:
+            conn.send((ok, value))
+        except (EOFError, OSError):
+            # client went away (e.g. terminated run process)
+            pass
+
+    def read_addresses(self, addrs):
+        # config registers are served from the shadow copy, the rest goes on
+        # the UART; failed reads are None and never cached
+        missing = [addr for addr in dict.fromkeys(addrs) if addr not in self.cached_addrs or self.shadow[addr] < 0]
+        values = dict(zip(missing, self.read_burst(missing)))
+        for addr in missing:
+            if addr in self.cached_addrs and values[addr] is not None:
+                self.shadow[addr] = values[addr]
+        self.cache_hits += len(addrs) - len(missing)
+        self.cache_misses += len(missing)
+        return [values[addr] if addr in values else self.shadow[addr] for addr in addrs]
+
+    def write_addresses(self, pairs, verify=True):
+        self.write_burst(pairs)
+        if not verify:
+            for addr, value in pairs:
+                if addr in self.cached_addrs:
+                    self.shadow[addr] = value & 0xFFFF
+            return []
+        values = self.read_burst([addr for addr, _ in pairs])
+        for (addr, _), rb in zip(pairs, values):
+            if addr in self.cached_addrs:
+                # unknown after a failed readback
+                self.shadow[addr] = rb if rb is not None else -1
+        return [(addr, value, rb) for (addr, value), rb in zip(pairs, values) if value != rb]
+
+    def read_burst(self, addrs):
+        # queue up to FPGA_BURST read commands, then collect the replies in
+        # order. A chunk with a missing or garbled reply is read again once the
+        # line is quiet, so that a late reply is not taken for the next address;
+        # still failing after FPGA_READ_RETRIES the values are None
+        values = []
+        for i in range(0, len(addrs), FPGA_BURST):
+            chunk = addrs[i:i+FPGA_BURST]
+            for _ in range(FPGA_READ_RETRIES):
+                if self.serial.in_waiting:
+                    self.resync()
+                replies = self.read_chunk(chunk)
+                if None not in replies:
+                    break
+                self.resync()
+            values.extend(replies)
+        return values
+
+    def read_chunk(self, chunk):
+        self.serial.write("".join(f"{str(hex(addr))[2:]}\n" for addr in chunk).encode())
+        replies = []
+        for _ in chunk:
+            reply = self.serial.read_until('\r'.encode())
+            try:
+                if not reply.endswith(b'\r'):
+                    raise ValueError(reply)
+                replies.append(int(reply.decode()[:-1], 16))
+            except (ValueError, UnicodeDecodeError):
+                # the rest of the chunk can no longer be trusted
+                return replies + [None] * (len(chunk) - len(replies))
+        return replies
+
+    def resync(self):
+        # drop whatever is still arriving until the line stays quiet
+        self.serial.reset_input_buffer()
+        time.sleep(FPGA_RESYNC_QUIET)
+        while self.serial.in_waiting:
+            self.serial.reset_input_buffer()
+            time.sleep(FPGA_RESYNC_QUIET)
+
+    def write_burst(self, pairs):
+        for i in range(0, len(pairs), FPGA_BURST):
+            chunk = pairs[i:i+FPGA_BURST]
+            self.serial.write("".join(f"{str(hex(addr))[2:]} {str(hex(value))[2:]}\n" for addr, value in chunk).encode())
+        self.serial.flush()
+        time.sleep(FPGA_WRITE_SETTLE)
+        self.serial.read_all()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='FPGA runcontrol broker, started by FPGADevice')
+    parser.add_argument('port', help='runcontrol serial port')
+    parser.add_argument('--baudrate', type=int, default=115200)
+    parser.add_argument('--cached', default='', help='comma separated addresses served from the shadow copy')
+    args = parser.parse_args()
+
+    FPGABroker(args.port, args.baudrate, [int(addr) for addr in args.cached.split(',') if addr]).run()
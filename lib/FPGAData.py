@@ -1,5 +1,194 @@
 import serial
 import time
+import numpy as np
+from collections import deque
+
+FPGA_EVENT_BUFSIZE = 16384      # ring buffer size (bytes)
+FPGA_EVENT_CHUNK = 4096         # max bytes moved by a single readinto
+
+# ASCII hex digit -> value, 0x10 marks an invalid character
+HEXVAL = [0x10] * 256
+for i, c in enumerate(b'0123456789'):
+    HEXVAL[c] = i
+for i, c in enumerate(b'ABCDEF'):
+    HEXVAL[c] = 10 + i
+    HEXVAL[c + 0x20] = 10 + i
+
+HEXVAL_NP = np.array(HEXVAL, dtype=np.uint8)
+FIELD_OFFSETS = (5 + 5 * np.arange(6)[:, None] + np.arange(4)).ravel()     # 24 hex digits of a packet
+
+def decode_packets(buf):
+    # vectorized decoder for a whole capture: returns numpy arrays (seconds,
+    # counter, pps_delta, counter_pulses) of every valid packet and the number
+    # of bytes consumed, the unconsumed tail may hold the start of a packet
+    a = np.frombuffer(buf, dtype=np.uint8)
+    size = EventFramer.PACKET_SIZE
+    if len(a) < size:
+        return np.zeros((4, 0), dtype=np.int64), 0
+
+    n = len(a) - size + 1
+    idx = np.flatnonzero((a[:n] == 0x42) & (a[1:n+1] == 0x41) & (a[2:n+2] == 0x41) & (a[3:n+3] == 0x42))
+    frames = a[idx[:, None] + np.arange(size)]
+
+    ok = (frames[:, 4::5] == 13).all(axis=1)
+    ok &= (frames[:, 35:39] == np.frombuffer(EventFramer.FOOTER, dtype=np.uint8)).all(axis=1)
+    nibbles = HEXVAL_NP[frames[:, FIELD_OFFSETS]].reshape(-1, 6, 4)
+    ok &= (nibbles < 0x10).all(axis=(1, 2))
+    idx, nibbles = idx[ok], nibbles[ok]
+
+    # a valid frame can only overlap another one through a BAAB word in its payload
+    if len(idx) > 1 and (np.diff(idx) < size).any():
+        keep, end = [], -1
+        for i, start in enumerate(idx):
+            if start >= end:
+                keep.append(i)
+                end = start + size
+        idx, nibbles = idx[keep], nibbles[keep]
+
+    w = nibbles.astype(np.int64)
+    w = (w[:, :, 0] << 12) | (w[:, :, 1] << 8) | (w[:, :, 2] << 4) | w[:, :, 3]
+    events = np.stack([
+        (w[:, 0] << 16) + w[:, 1],
+        ((w[:, 2] << 16) | w[:, 3]) * 10,
+        (w[:, 4] - 32767) * 10,
+        w[:, 5],
+    ])
+    consumed = len(a) - size + 1
+    if len(idx):
+        consumed = max(consumed, int(idx[-1]) + size)
+    return events, consumed
+
+
+class EventFramer:
+
+    # streaming decoder for BAAB...FEEF packets: bytes are appended to a
+    # persistent ring buffer and complete packets are decoded in place,
+    # resyncing on the header after corrupt or truncated frames
+
+    HEADER = b'BAAB'
+    FOOTER = b'FEEF'
+    PACKET_SIZE = 40    # "BAAB\r" + 6 x "XXXX\r" + "FEEF\r"
+
+    def __init__(self, size=FPGA_EVENT_BUFSIZE):
+        self.buf = bytearray(size)
+        self.view = memoryview(self.buf)
+        self.reset()
+
+    def reset(self):
+        self.head = 0
+        self.tail = 0
+        self.last_pulses = None
+        self.packets = 0
+        self.corrupt = 0
+        self.partial = 0
+        self.dropped = 0
+        self.gaps = 0
+        self.missed = 0
+
+    def stats(self):
+        return {'packets': self.packets, 'corrupt': self.corrupt, 'partial': self.partial,
+            'dropped_bytes': self.dropped, 'gaps': self.gaps, 'missed': self.missed}
+
+    def space(self, n=FPGA_EVENT_CHUNK):
+        # writable slice for readinto, data is compacted to the front when needed
+        if self.head == self.tail:
+            self.head = self.tail = 0
+        elif len(self.buf) - self.tail < n and self.head > 0:
+            size = self.tail - self.head
+            self.view[:size] = self.view[self.head:self.tail]
+            self.head, self.tail = 0, size
+        return self.view[self.tail:min(self.tail + n, len(self.buf))]
+
+    def commit(self, n):
+        self.tail += n
+
+    def feed(self, data):
+        data = memoryview(data)
+        while len(data):
+            dst = self.space(len(data))
+            n = len(dst)
+            if n == 0:
+                # buffer full of undecodable bytes
+                self.dropped += self.tail - self.head
+                self.head = self.tail = 0
+                continue
+            dst[:] = data[:n]
+            self.commit(n)
+            data = data[n:]
+
+    def word(self, i):
+        buf = self.buf
+        h0, h1, h2, h3 = HEXVAL[buf[i]], HEXVAL[buf[i+1]], HEXVAL[buf[i+2]], HEXVAL[buf[i+3]]
+        if (h0 | h1 | h2 | h3) & 0x10 or buf[i+4] != 13:
+            return -1
+        return (h0 << 12) | (h1 << 8) | (h2 << 4) | h3
+
+    def decode(self, out):
+        buf = self.buf
+        while True:
+            idx = buf.find(self.HEADER, self.head, self.tail)
+            if idx < 0:
+                # keep the last bytes, a header may be split across reads
+                keep = max(self.tail - len(self.HEADER) + 1, self.head)
+                self.dropped += keep - self.head
+                self.head = keep
+                return out
+            self.dropped += idx - self.head
+            self.head = idx
+            if self.tail - idx < self.PACKET_SIZE:
+                return out
+
+            if buf.startswith(self.FOOTER, idx + 35) and buf[idx+4] == 13:
+                w0, w1, w2 = self.word(idx + 5), self.word(idx + 10), self.word(idx + 15)
+                w3, w4, w5 = self.word(idx + 20), self.word(idx + 25), self.word(idx + 30)
+                if (w0 | w1 | w2 | w3 | w4 | w5) < 0:
+                    self.corrupt += 1
+                    self.dropped += 1
+                    self.head = idx + 1
+                    continue
+                self.head = idx + self.PACKET_SIZE
+                self.packets += 1
+                self.check_pulses(w5)
+                out.append(((w0 << 16) + w1, ((w2 << 16) | w3) * 10, (w4 - 32767) * 10, w5))
+            else:
+                nxt = buf.find(self.HEADER, idx + 1, idx + self.PACKET_SIZE)
+                if nxt >= 0:
+                    # sender restarted in the middle of a frame
+                    self.partial += 1
+                    self.dropped += nxt - idx
+                    self.head = nxt
+                else:
+                    self.corrupt += 1
+                    self.dropped += 1
+                    self.head = idx + 1
+
+    def decode_batch(self):
+        # vectorized variant of decode() for high rate capture, returns numpy arrays
+        events, consumed = decode_packets(self.view[self.head:self.tail])
+        n = events.shape[1]
+        self.packets += n
+        self.dropped += consumed - n * self.PACKET_SIZE
+        if n:
+            pulses = events[3]
+            if self.last_pulses is not None:
+                pulses = np.concatenate(([self.last_pulses], pulses))
+            diff = np.diff(pulses) & 0xFFFF
+            gaps = diff != 1
+            self.gaps += int(gaps.sum())
+            self.missed += int(np.maximum(diff[gaps & (diff < 0x8000)] - 1, 0).sum())
+            self.last_pulses = int(pulses[-1])
+        self.head += consumed
+        return events
+
+    def check_pulses(self, pulses):
+        if self.last_pulses is not None:
+            diff = (pulses - self.last_pulses) & 0xFFFF
+            if diff != 1:
+                self.gaps += 1
+                if diff < 0x8000:
+                    self.missed += max(diff - 1, 0)
+        self.last_pulses = pulses
+
 
 class FPGAData:
 
@@ -24,39 +213,66 @@ class FPGAData:
         self.FOOTER = 'FEEF'
         self.PACKET_SIZE = 40  # 4 byte di header + 12 byte di dati + 4 byte di footer
 
+        self.framer = EventFramer()
+        self.events = deque()
+        self.highwater = 0
+
         try:
             self.serial = serial.Serial(self.port, self.baudrate, timeout = 2)
         except serial.SerialException as e:
             raise RuntimeError
 
+    def reset(self):
+        # drop stale input and counters, e.g. at the start of a run
+        self.serial.reset_input_buffer()
+        self.framer.reset()
+        self.events.clear()
+        self.highwater = 0
+
+    def stats(self):
+        ret = self.framer.stats()
+        ret['in_waiting_max'] = self.highwater
+        return ret
+
+    def fill(self, block=True, decode=True):
+        n = self.serial.in_waiting
+        self.highwater = max(self.highwater, n)
+        if n == 0 and not block:
+            return 0
+        n = self.serial.readinto(self.framer.space(min(max(n, 1), FPGA_EVENT_CHUNK)))
+        self.framer.commit(n)
+        if decode:
+            self.framer.decode(self.events)
+        return n
+
+    def read_batch(self):
+        # non blocking, numpy arrays (seconds, counter, pps_delta, counter_pulses)
+        # of the packets received so far
+        while self.fill(block=False, decode=False) > 0:
+            pass
+        return self.framer.decode_batch()
+
+    def read_events(self):
+        # non blocking: every complete packet received so far
+        while self.fill(block=False) > 0:
+            pass
+        events = list(self.events)
+        self.events.clear()
+        return events
+
     def read_event(self):
-        
-            self.buffer = self.serial.read(self.PACKET_SIZE)  # Legge il pacchetto intero
-            
-            # Cerca l'header
-            start_idx = self.buffer.find(self.HEADER.encode())
-            if start_idx != -1 and len(self.buffer) >= start_idx + self.PACKET_SIZE:
-                packet = self.buffer[start_idx:start_idx + self.PACKET_SIZE]
-
-                if packet[-5:-1] == self.FOOTER.encode():
-                    data = packet[5:-5]
-                    try:
-                        values = data.decode().split('\r')[:-1]
-                        self.seconds = (int(values[0], 16) << 16) + int(values[1], 16)
-                        self.counter = (int(values[2], 16) << 16) + int(values[3], 16) * 10
-                        #self.length = (int(values[4], 16) << 16) + int(values[5], 16) * 10
-                        self.pps_delta = (int(values[4], 16) - 32767) * 10
-                        self.counter_pulses = int(values[5], 16)
-                        return self.seconds, self.counter, self.pps_delta, self.counter_pulses
-                    except (IndexError, ValueError, UnicodeDecodeError) as e:
-                        print("Errore nel parsing dei dati:", e)
-                else:
-                    print("Errore: pacchetto non valido!")
-
-            # Se il pacchetto non è valido o non è stato trovato
-            self.seconds = 0
-            self.counter = 0
-            self.pps_delta = 0
-            self.counter_pulses=0
-                
+        deadline = time.monotonic() + self.serial.timeout
+        while not self.events and time.monotonic() < deadline:
+            self.fill()
+
+        if self.events:
+            self.seconds, self.counter, self.pps_delta, self.counter_pulses = self.events.popleft()
             return self.seconds, self.counter, self.pps_delta, self.counter_pulses
+
+        # Se il pacchetto non è valido o non è stato trovato
+        self.seconds = 0
+        self.counter = 0
+        self.pps_delta = 0
+        self.counter_pulses=0
+
+        return self.seconds, self.counter, self.pps_delta, self.counter_pulses
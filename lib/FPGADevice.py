@@ -1,7 +1,11 @@
 
-import serial
+import os
 import time
-from multiprocessing import Lock
+import fcntl
+import threading
+from multiprocessing.connection import Client
+from lib.FPGABroker import FPGABroker, FPGA_BROKER_AUTHKEY, PRIORITY_NORMAL
+from lib.FPGAWatcher import FPGAWatcher, WATCH_MAX_INTERVAL, WATCH_TIMEOUT_MARGIN
 
 class FPGADevice:
 
@@ -21,141 +25,252 @@ class FPGADevice:
 
         self.port = port
         self.baudrate = baudrate
-        self.serial = None
-        self.mutex = Lock() 
-
-        try:
-            self.serial = serial.Serial(self.port, self.baudrate, timeout = 2)
-        except serial.SerialException as e:
-            raise RuntimeError
-
-        self.regmap = {}
-        self.regmap["unixtime"] = FPGARegister(0x0, 2)
-        self.regmap["pps_delay"] = FPGARegister(0x5, 2)
-        self.regmap["pps_distance"] = FPGARegister(0xB)
-        self.regmap["pid_value"] = FPGARegister(0xC)
-        self.regmap["time_cnt"] = FPGARegister(0xD, 2)
-        self.regmap["vcxo_value"] = FPGARegister(0xF)
-        self.regmap["pid_dac"] = FPGARegister(0x10)
-        self.regmap["pid_dac_p"] = FPGARegister(0x11)
-        self.regmap["pid_dac_i"] = FPGARegister(0x12)
-        self.regmap["pulse_width"] = FPGARegister(0x13)
-        self.regmap["pulse_energy"] = FPGARegister(0x14, 2)
-        self.regmap["arm_unixtime"] = FPGARegister(0x19, 2)
-        self.regmap["pulse_period"] = FPGARegister(0x1B, 2)
-        self.regmap["mux_bnc_0"] = FPGARegister(0x1D)
-        self.regmap["mux_bnc_1"] = FPGARegister(0x1E)
-        self.regmap["mux_bnc_2"] = FPGARegister(0x1F)
-        self.regmap["mux_bnc_3"] = FPGARegister(0x20)
-        self.regmap["mux_bnc_4"] = FPGARegister(0x21)
-        self.regmap["shots_num"] = FPGARegister(0x22, 2)
-        self.regmap["shots_cnt"] = FPGARegister(0x24, 2)
-
-        self.iomap = {}
-        self.iomap["laser_start"] = FPGAIO(0x3, 0)
-        self.iomap["laser_en"] = FPGAIO(0x3, 1)
-        self.iomap["timestamp_en"] = FPGAIO(0x3, 2)
-        self.iomap["cover_raman_closed"] = FPGAIO(0x16, 0)
-        self.iomap["cover_raman_open"] = FPGAIO(0x16, 1)
-        self.iomap["cover_steer_closed"] = FPGAIO(0x16, 2, inverted=True)
-        self.iomap["cover_steer_open"] = FPGAIO(0x16, 3, inverted=True)
-        self.iomap["rain"] = FPGAIO(0x16, 4)
-        self.iomap["norain"] = FPGAIO(0x16, 5)
-        self.iomap["inverter"] = FPGAIO(0x17, 0)
-        self.iomap["flipper_steer"] = FPGAIO(0x17, 1)
-        self.iomap["flipper_raman"] = FPGAIO(0x17, 2)
-        self.iomap["flipper_atten"] = FPGAIO(0x17, 3)
-
-        self.iomap["pps_ok"] = FPGAIO(0x7, 2)
-        self.iomap["jc_lock"] = FPGAIO(0x8, 2)
-        self.iomap["vcxo_lock"] = FPGAIO(0x8, 3)
-        self.iomap["force_align"] = FPGAIO(0x9, 4)
+        self.broker = None
+        self.connections = {}
+        self.watchers = {}
+
+        self.regmap, self.iomap = FPGADevice.register_map()
+
+        volatile = set()
+        cached = set()
+        for entry in list(self.regmap.values()) + list(self.iomap.values()):
+            if entry.get_volatile():
+                volatile.update(entry.get_addrs())
+            else:
+                cached.update(entry.get_addrs())
+        self.cached_addrs = cached - volatile
+
+        # the serial port is owned by a broker process shared by every client
+        self.address = FPGABroker.get_address(self.port)
+        self._connect()
+
+    @staticmethod
+    def register_map():
+        regmap = {}
+        regmap["unixtime"] = FPGARegister(0x0, 2, volatile=True)
+        regmap["pps_delay"] = FPGARegister(0x5, 2)
+        regmap["pps_distance"] = FPGARegister(0xB, volatile=True)
+        regmap["pid_value"] = FPGARegister(0xC, volatile=True)
+        regmap["time_cnt"] = FPGARegister(0xD, 2, volatile=True)
+        regmap["vcxo_value"] = FPGARegister(0xF, volatile=True)
+        regmap["pid_dac"] = FPGARegister(0x10, volatile=True)
+        regmap["pid_dac_p"] = FPGARegister(0x11)
+        regmap["pid_dac_i"] = FPGARegister(0x12)
+        regmap["pulse_width"] = FPGARegister(0x13)
+        regmap["pulse_energy"] = FPGARegister(0x14, 2)
+        regmap["arm_unixtime"] = FPGARegister(0x19, 2, volatile=True)
+        regmap["pulse_period"] = FPGARegister(0x1B, 2)
+        regmap["mux_bnc_0"] = FPGARegister(0x1D)
+        regmap["mux_bnc_1"] = FPGARegister(0x1E)
+        regmap["mux_bnc_2"] = FPGARegister(0x1F)
+        regmap["mux_bnc_3"] = FPGARegister(0x20)
+        regmap["mux_bnc_4"] = FPGARegister(0x21)
+        regmap["shots_num"] = FPGARegister(0x22, 2)
+        regmap["shots_cnt"] = FPGARegister(0x24, 2, volatile=True)
+
+        iomap = {}
+        iomap["laser_start"] = FPGAIO(0x3, 0, volatile=True)     # may be cleared by firmware
+        iomap["laser_en"] = FPGAIO(0x3, 1)
+        iomap["timestamp_en"] = FPGAIO(0x3, 2)
+        iomap["cover_raman_closed"] = FPGAIO(0x16, 0, volatile=True)
+        iomap["cover_raman_open"] = FPGAIO(0x16, 1, volatile=True)
+        iomap["cover_steer_closed"] = FPGAIO(0x16, 2, inverted=True, volatile=True)
+        iomap["cover_steer_open"] = FPGAIO(0x16, 3, inverted=True, volatile=True)
+        iomap["rain"] = FPGAIO(0x16, 4, volatile=True)
+        iomap["norain"] = FPGAIO(0x16, 5, volatile=True)
+        iomap["inverter"] = FPGAIO(0x17, 0)
+        iomap["flipper_steer"] = FPGAIO(0x17, 1)
+        iomap["flipper_raman"] = FPGAIO(0x17, 2)
+        iomap["flipper_atten"] = FPGAIO(0x17, 3)
+
+        iomap["pps_ok"] = FPGAIO(0x7, 2, volatile=True)
+        iomap["jc_lock"] = FPGAIO(0x8, 2, volatile=True)
+        iomap["vcxo_lock"] = FPGAIO(0x8, 3, volatile=True)
+        iomap["force_align"] = FPGAIO(0x9, 4, volatile=True)
+        return regmap, iomap
 
     def close(self):
-        self.serial.close()
-
-    def critical_section(func):
-        def wrapper(self, *args, **kwargs):
-            self.mutex.acquire()
-            ret = func(self, *args, **kwargs)
-            self.mutex.release()
-            return ret
-        return wrapper
-
-    @critical_section
-    def read_address(self, addr):
-        value = 0
-        while True:
-            self.serial.write(f"{str(hex(addr))[2:]}\n".encode())
+        # the broker keeps serving the other programs
+        for conn in self.connections.values():
+            conn.close()
+        self.connections = {}
+
+    def shutdown(self):
+        # stop the broker, for every client
+        self._request('close')
+        if self.broker is not None:
+            self.broker.wait()
+            self.broker = None
+        self.close()
+
+    def _connection(self):
+        # one connection per process and thread, forked run processes open their own
+        key = (os.getpid(), threading.get_ident())
+        if self.connections.get(key, None) is None:
+            self.connections[key] = Client(self.address, family='AF_UNIX', authkey=FPGA_BROKER_AUTHKEY)
+        return self.connections[key]
+
+    def _connect(self):
+        # connect to the broker, starting it when none listens: the lock file
+        # keeps two programs starting together from spawning two brokers
+        with open(f"{self.address}.lock", 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
             try:
-                value = int(self.serial.read_until('\r'.encode()).decode()[:-1], 16)
-            except:
-                continue
-            finally:
+                return self._connection()
+            except (FileNotFoundError, ConnectionRefusedError):
+                self.broker = FPGABroker.spawn(self.port, self.baudrate, self.cached_addrs)
+                return self._connection()
+
+    def _request(self, op, payload=None, priority=PRIORITY_NORMAL):
+        for attempt in range(2):
+            try:
+                conn = self._connect() if attempt else self._connection()
+                conn.send((op, priority, payload))
+                ok, value = conn.recv()
                 break
+            except (EOFError, OSError):
+                # broker stopped or killed: the request is sent once more to
+                # the broker running now, or to a new one
+                conn = self.connections.pop((os.getpid(), threading.get_ident()), None)
+                if conn is not None:
+                    conn.close()
+                if attempt:
+                    raise
+        if not ok:
+            raise RuntimeError(value)
         return value
 
-    @critical_section
-    def write_address(self, addr, value):
-        self.serial.write(f"{str(hex(addr))[2:]} {str(hex(value))[2:]}\n".encode())
-        time.sleep(0.1)
-        self.serial.read_all()
+    def read_address(self, addr, priority=PRIORITY_NORMAL):
+        return self.read_addresses([addr], priority)[0]
 
-    def read_register(self, name):
-        if self.regmap.get(name, None) is None:
-            raise NameError
-        addr = self.regmap[name].get_addr()
-        width = self.regmap[name].get_width()
-        i = value = 0
-        while i < width:
-            value = value | (self.read_address(addr+i) << (i * 16))
-            i = i + 1
-        return value
+    def write_address(self, addr, value, priority=PRIORITY_NORMAL):
+        self.write_addresses([(addr, value)], verify=False, priority=priority)
+
+    def read_addresses(self, addrs, priority=PRIORITY_NORMAL):
+        return self._request('read', list(addrs), priority)
+
+    def write_addresses(self, pairs, verify=True, priority=PRIORITY_NORMAL):
+        return self._request('write', (list(pairs), verify), priority)
+
+    def invalidate_cache(self):
+        # call after an FPGA reset or power cycle
+        self._request('invalidate')
 
-    def write_register(self, name, value):
-        addr = self.regmap[name].get_addr()
-        width = self.regmap[name].get_width()
-        i = 0
-        while i < width:
-            self.write_address(addr+i, (value & (0xFFFF << (i*16))) >> (i*16))
-            i = i + 1
+    def cache_stats(self):
+        return self._request('stats')
 
-    def read_bit(self, name):
-        return self.read_dio(name) 
+    def read_register(self, name, priority=PRIORITY_NORMAL):
+        return self.read_registers([name], priority)[name]
 
-    def write_bit(self, name, b):
-        self.write_dio(name, b)
+    def write_register(self, name, value, priority=PRIORITY_NORMAL):
+        self.write_registers({name: value}, verify=False, priority=priority)
 
-    def read_dio(self, name):
+    def read_registers(self, names, priority=PRIORITY_NORMAL):
+        addrs = []
+        for name in names:
+            if self.regmap.get(name, None) is None:
+                raise NameError
+            addrs.extend(self.regmap[name].get_addrs())
+        words = self.read_addresses(addrs, priority)
+        values = {}
+        for name in names:
+            width = self.regmap[name].get_width()
+            values[name] = self.regmap[name].join(words[:width])
+            words = words[width:]
+        return values
+
+    def write_registers(self, values, verify=True, priority=PRIORITY_NORMAL):
+        pairs = []
+        for name, value in values.items():
+            if self.regmap.get(name, None) is None:
+                raise NameError
+            pairs.extend(zip(self.regmap[name].get_addrs(), self.regmap[name].split(int(value))))
+        readback = {addr: rb for addr, _, rb in self.write_addresses(pairs, verify, priority)}
+        failed = {}
+        for name, value in values.items():
+            addrs = self.regmap[name].get_addrs()
+            if any(addr in readback for addr in addrs):
+                words = self.regmap[name].split(int(value))
+                failed[name] = self.regmap[name].join([readback.get(addr, word) for addr, word in zip(addrs, words)])
+        return failed
+
+    def read_values(self, names, priority=PRIORITY_NORMAL):
+        # read any mix of registers and DIOs with a single pipelined request
+        addrs = []
+        for name in names:
+            if self.regmap.get(name, None) is not None:
+                addrs.extend(self.regmap[name].get_addrs())
+            elif self.iomap.get(name, None) is not None:
+                addrs.append(self.iomap[name].get_addr())
+            else:
+                raise NameError
+        addrs = list(dict.fromkeys(addrs))
+        words = dict(zip(addrs, self.read_addresses(addrs, priority)))
+        values = []
+        for name in names:
+            if self.regmap.get(name, None) is not None:
+                reg = self.regmap[name]
+                values.append(reg.join([words[addr] for addr in reg.get_addrs()]))
+            else:
+                io = self.iomap[name]
+                values.append(bool(words[io.get_addr()] & (1 << io.get_bit())) != io.get_inverted())
+        return values
+
+    def get_watcher(self):
+        # the polling thread is per process, forked run processes start their own
+        watcher = self.watchers.get(os.getpid(), None)
+        if watcher is None or not watcher.thr.is_alive():
+            self.watchers[os.getpid()] = FPGAWatcher(self)
+        return self.watchers[os.getpid()]
+
+    def subscribe(self, names, predicate, callback, timeout=None, eta=None):
+        return self.get_watcher().subscribe(names, predicate, callback, timeout, eta)
+
+    def watch(self, names, predicate, timeout, eta=None):
+        # block until predicate(*values) is true, returns False on timeout or
+        # when the polling thread is gone
+        watcher = self.get_watcher()
+        sub = watcher.subscribe(names, predicate, timeout=timeout, eta=eta)
+        deadline = None if timeout is None else time.monotonic() + timeout + WATCH_TIMEOUT_MARGIN
+        while not sub.done.wait(WATCH_MAX_INTERVAL):
+            if not watcher.thr.is_alive() or (deadline is not None and time.monotonic() >= deadline):
+                watcher.unsubscribe(sub)
+                return False
+        return sub.matched
+
+    def read_bit(self, name, priority=PRIORITY_NORMAL):
+        return self.read_dio(name, priority) 
+
+    def write_bit(self, name, b, priority=PRIORITY_NORMAL):
+        self.write_dio(name, b, priority)
+
+    def read_dio(self, name, priority=PRIORITY_NORMAL):
         if self.iomap.get(name, None) is None:
             raise NameError
         addr = self.iomap[name].get_addr()
         bit = self.iomap[name].get_bit()
         inverted = self.iomap[name].get_inverted()
-        value = bool(self.read_address(addr) & (1 << bit))
+        value = bool(self.read_address(addr, priority) & (1 << bit))
         if inverted:
             return not value
         return value
 
-    def write_dio(self, name, b):
+    def write_dio(self, name, b, priority=PRIORITY_NORMAL):
         if self.iomap.get(name, None) is None:
             raise NameError
         addr = self.iomap[name].get_addr()
         bit = self.iomap[name].get_bit()
-        value = self.read_address(addr)
-        if b:
-            value = value | (1 << bit)
-        else:
-            value = value & ~(1 << bit)
-        self.write_address(addr, value)
+        # read-modify-write is done atomically by the broker
+        self._request('dio', (addr, bit, bool(b)), priority)
 
     
 class FPGAIO(FPGADevice):
 
-    def __init__(self, regaddr, bit, inverted=False):
+    def __init__(self, regaddr, bit, inverted=False, volatile=False):
         self.regaddr = regaddr
         self.bit = bit
         self.inverted = inverted
+        self.volatile = volatile
 
     def get_addr(self):
         return self.regaddr
@@ -166,15 +281,37 @@ class FPGAIO(FPGADevice):
     def get_inverted(self):
         return self.inverted
 
+    def get_volatile(self):
+        return self.volatile
+
+    def get_addrs(self):
+        return [self.regaddr]
+
 
 class FPGARegister(FPGADevice):
 
-    def __init__(self, regaddr, width = 1):
+    def __init__(self, regaddr, width = 1, volatile=False):
         self.regaddr = regaddr
         self.width = width
+        self.volatile = volatile
 
     def get_addr(self):
         return self.regaddr
 
     def get_width(self):
         return self.width
+
+    def get_volatile(self):
+        return self.volatile
+
+    def get_addrs(self):
+        return [self.regaddr + i for i in range(self.width)]
+
+    def split(self, value):
+        return [(value >> (i * 16)) & 0xFFFF for i in range(self.width)]
+
+    def join(self, words):
+        value = 0
+        for i, word in enumerate(words):
+            value = value | (word << (i * 16))
+        return value
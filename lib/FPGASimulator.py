@@ -0,0 +1,157 @@
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.PtySimulator import PtySimulator
+from lib.FPGADevice import FPGADevice
+
+class FPGASimulator(PtySimulator):
+
+    # runcontrol stand-in: answers "<addr>\n" reads and "<addr> <value>\n" writes
+    # on the runcontrol pty and emits BAAB...FEEF event packets on the data pty.
+    # speedup > 1 compresses pulse_period to run shots faster than real time
+
+    def __init__(self, runcontrol_link=None, data_link=None, speedup=1.0, jitter_ticks=5):
+        super().__init__(link=runcontrol_link, terminator=b'\n')
+        self.data = PtySimulator(link=data_link)
+        self.speedup = speedup
+        self.jitter_ticks = jitter_ticks
+        self.regmap, self.iomap = FPGADevice.register_map()
+        self.words = {}
+        self.mutex = threading.Lock()
+        self.shots_thr = None
+        # fault injection: the next late_reads read replies come late_delay s late
+        self.late_reads = 0
+        self.late_delay = 0.0
+
+        # idle state: PPS and clocks locked, Raman cover closed, no rain
+        for name in ['pps_ok', 'jc_lock', 'vcxo_lock', 'cover_raman_closed', 'norain', 'cover_steer_open']:
+            self.set_dio(name, True)
+        self.set_register('pulse_period', 100_000_000)
+
+    def start(self):
+        self.data.start()
+        return super().start()
+
+    def stop(self):
+        self.set_dio('laser_en', False)
+        if self.shots_thr is not None:
+            self.shots_thr.join()
+        self.data.stop()
+        super().stop()
+
+    def delay_reads(self, n, delay):
+        self.late_reads = n
+        self.late_delay = delay
+
+    def get_register(self, name):
+        reg = self.regmap[name]
+        return reg.join([self.words.get(addr, 0) for addr in reg.get_addrs()])
+
+    def set_register(self, name, value):
+        reg = self.regmap[name]
+        for addr, word in zip(reg.get_addrs(), reg.split(value)):
+            self.words[addr] = word
+
+    def get_dio(self, name):
+        io = self.iomap[name]
+        value = bool(self.words.get(io.get_addr(), 0) & (1 << io.get_bit()))
+        return value != io.get_inverted()
+
+    def set_dio(self, name, b):
+        io = self.iomap[name]
+        value = self.words.get(io.get_addr(), 0)
+        if b != io.get_inverted():
+            value = value | (1 << io.get_bit())
+        else:
+            value = value & ~(1 << io.get_bit())
+        self.words[io.get_addr()] = value
+
+    def handle(self, line):
+        parts = line.split()
+        try:
+            addr = int(parts[0], 16)
+            if len(parts) == 1:
+                if self.late_reads > 0:
+                    self.late_reads -= 1
+                    time.sleep(self.late_delay)
+                self.write(f"{str(hex(self.read_word(addr)))[2:]}\r")
+            elif len(parts) == 2:
+                self.write_word(addr, int(parts[1], 16) & 0xFFFF)
+        except (IndexError, ValueError):
+            self.write("?\r")
+
+    def read_word(self, addr):
+        with self.mutex:
+            if addr in self.regmap['unixtime'].get_addrs():
+                self.set_register('unixtime', int(time.time()))
+            elif addr in self.regmap['time_cnt'].get_addrs():
+                self.set_register('time_cnt', int((time.time() % 1) * 100_000_000))
+            return self.words.get(addr, 0)
+
+    def write_word(self, addr, value):
+        with self.mutex:
+            self.words[addr] = value
+            start = addr == self.iomap['laser_start'].get_addr() and self.get_dio('laser_start') and self.get_dio('laser_en')
+        if start and (self.shots_thr is None or not self.shots_thr.is_alive()):
+            self.shots_thr = threading.Thread(target=self.fire, daemon=True)
+            self.shots_thr.start()
+
+    def fire(self):
+        with self.mutex:
+            nshots = self.get_register('shots_num')
+            period = self.get_register('pulse_period') * 10e-9 / self.speedup
+            pps_delay = self.get_register('pps_delay') * 10e-9
+            self.set_register('shots_cnt', 0)
+
+        # first shot pps_delay after the next PPS, the host clock plays the GPS
+        t0 = int(time.time()) + 1 + pps_delay
+        for n in range(1, nshots + 1):
+            t = t0 + (n - 1) * period
+            delay = t - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            with self.mutex:
+                if not self.get_dio('laser_en'):
+                    break
+                self.set_register('shots_cnt', n)
+                timestamp = self.get_dio('timestamp_en')
+            if timestamp:
+                self.data.write(self.event_packet(t, n))
+
+        with self.mutex:
+            self.set_dio('laser_start', False)
+
+    def event_packet(self, t, pulses):
+        # layout parsed by FPGAData: BAAB, six 16-bit hex words, FEEF, each field \r terminated
+        jitter = random.randint(-self.jitter_ticks, self.jitter_ticks)
+        seconds = int(t)
+        # 32-bit count of 10 ns ticks since the PPS, sent as hi/lo halves
+        ticks = max(int(round((t - seconds) * 1e8)) + jitter, 0)
+        hi = ticks >> 16
+        lo = ticks & 0xFFFF
+        fields = [
+            (seconds >> 16) & 0xFFFF, seconds & 0xFFFF,
+            hi & 0xFFFF, lo & 0xFFFF,
+            32767 + jitter, pulses & 0xFFFF,
+        ]
+        return "BAAB\r" + "".join(f"{value:04X}\r" for value in fields) + "FEEF\r"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='FPGA runcontrol/data simulator')
+    parser.add_argument('--runcontrol', default=None, help='symlink for the runcontrol pty (e.g. /tmp/runcontrol)')
+    parser.add_argument('--data', default=None, help='symlink for the data pty (e.g. /tmp/data0)')
+    parser.add_argument('--speedup', type=float, default=1.0, help='time compression factor for pulse_period')
+    args = parser.parse_args()
+
+    sim = FPGASimulator(args.runcontrol, args.data, args.speedup).start()
+    print(f"runcontrol: {sim.port}, data: {sim.data.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
@@ -0,0 +1,119 @@
+import time
+import threading
+from lib.FPGABroker import PRIORITY_NORMAL
+
+WATCH_MIN_INTERVAL = 0.05   # fastest poll, used close to the expected completion (s)
+WATCH_MAX_INTERVAL = 1.0    # slowest poll, bounds the detection latency (s)
+WATCH_BACKOFF = 1.5
+WATCH_TIMEOUT_MARGIN = 2.0  # extra wait of a blocking watch past its timeout (s)
+
+class Subscription:
+
+    def __init__(self, names, predicate, callback, timeout, eta, min_interval, max_interval):
+        self.names = names
+        self.predicate = predicate
+        self.callback = callback
+        self.deadline = None if timeout is None else time.monotonic() + timeout
+        self.eta = eta
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.backoff = min_interval
+        self.next_poll = time.monotonic()
+        self.values = None
+        self.matched = False
+        self.done = threading.Event()
+
+    def interval(self, now):
+        if self.eta is not None and self.eta > now:
+            # poll fast near the expected completion, slow when it is far away
+            interval = max((self.eta - now) / 2, self.min_interval)
+        else:
+            interval = self.backoff
+            self.backoff = min(self.backoff * WATCH_BACKOFF, self.max_interval)
+        interval = min(interval, self.max_interval)
+        if self.deadline is not None:
+            interval = min(interval, max(self.deadline - now, 0))
+        return interval
+
+    def complete(self, matched, values):
+        self.matched = matched
+        self.values = values
+        self.done.set()
+        if self.callback is not None:
+            try:
+                self.callback(matched, values)
+            except Exception as e:
+                print(f"FPGA:WATCH:ERROR:Callback on {self.names} failed: {e}")
+
+    def cancel(self):
+        self.done.set()
+
+    def wait(self, timeout=None):
+        self.done.wait(timeout)
+        return self.matched
+
+
+class FPGAWatcher:
+
+    # polls FPGA registers/DIOs on behalf of all the subscriptions of a process:
+    # due subscriptions are served with a single pipelined read
+
+    def __init__(self, fpga, priority=PRIORITY_NORMAL):
+        self.fpga = fpga
+        self.priority = priority
+        self.subscriptions = []
+        self.cond = threading.Condition()
+        self.thr = threading.Thread(target=self.loop, daemon=True)
+        self.thr.start()
+
+    def subscribe(self, names, predicate, callback=None, timeout=None, eta=None,
+            min_interval=WATCH_MIN_INTERVAL, max_interval=WATCH_MAX_INTERVAL):
+        if isinstance(names, str):
+            names = (names,)
+        sub = Subscription(tuple(names), predicate, callback, timeout, eta, min_interval, max_interval)
+        with self.cond:
+            self.subscriptions.append(sub)
+            self.cond.notify()
+        return sub
+
+    def unsubscribe(self, sub):
+        with self.cond:
+            if sub in self.subscriptions:
+                self.subscriptions.remove(sub)
+        sub.cancel()
+
+    def loop(self):
+        while True:
+            with self.cond:
+                self.subscriptions = [s for s in self.subscriptions if not s.done.is_set()]
+                if not self.subscriptions:
+                    self.cond.wait()
+                    continue
+                now = time.monotonic()
+                due = [s for s in self.subscriptions if s.next_poll <= now]
+                if not due:
+                    self.cond.wait(min(s.next_poll for s in self.subscriptions) - now)
+                    continue
+
+            names = list(dict.fromkeys(name for s in due for name in s.names))
+            try:
+                values = dict(zip(names, self.fpga.read_values(names, self.priority)))
+            except Exception:
+                values = None
+
+            now = time.monotonic()
+            for s in due:
+                v = None if values is None else tuple(values[name] for name in s.names)
+                try:
+                    matched = v is not None and s.predicate(*v)
+                except Exception as e:
+                    # a faulty predicate ends its own subscription only
+                    print(f"FPGA:WATCH:ERROR:Predicate on {s.names} failed: {e}")
+                    s.complete(False, v)
+                    continue
+                if matched:
+                    s.complete(True, v)
+                elif s.deadline is not None and now >= s.deadline:
+                    s.complete(False, v)
+                else:
+                    s.next_poll = now + s.interval(now)
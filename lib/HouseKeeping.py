@@ -15,6 +15,7 @@ from lib.TLA2518 import TLA2518
 from lib.LTC2983 import LTC2983
 from lib.LTC2983_const import *
 from lib.FPGADevice import FPGADevice
+from lib.FPGABroker import PRIORITY_LOW
 
 class HouseKeeping:
 
@@ -100,10 +101,10 @@ class HouseKeeping:
                 d['value'] = round(self.tcont.read_temperature(d['channel']), 2)
             elif d['dev'] == 'dio':
                 if d['name'] == 'rain':
-                    d['error'] = self.fpga.read_dio('rain') == self.fpga.read_dio('norain')
-                    d['value'] = self.fpga.read_dio('rain')
+                    d['error'] = self.fpga.read_dio('rain', PRIORITY_LOW) == self.fpga.read_dio('norain', PRIORITY_LOW)
+                    d['value'] = self.fpga.read_dio('rain', PRIORITY_LOW)
                 else:
-                    d['value'] = self.fpga.read_dio(d['name'])
+                    d['value'] = self.fpga.read_dio(d['name'], PRIORITY_LOW)
             elif d['dev'] == 'gps':
                 if d['name'] == 'gps_fix':
                     d['value'] = self.gpsd.fix.mode > 1
@@ -0,0 +1,158 @@
+import math
+import time
+import datetime
+import logging
+import threading
+import multiprocessing
+from logging.handlers import TimedRotatingFileHandler
+
+TELEMETRY_PERIOD = 1.0              # sampling period (s)
+TELEMETRY_REPLY_TIMEOUT = 0.5       # deadline for the replies of one sample (s)
+TELEMETRY_MAX_AGE_PERIODS = 3       # samples older than this many periods are stale
+# published values, in CSV column order
+TELEMETRY_FIELDS = ['time', 'state', 'sbyte', 'hbyte1', 'hbyte2', 'hbyte3',
+    'head_temp', 'dump_temp', 'plate_temp', 'shots', 'user_shots']
+TELEMETRY_QUERIES = ["$STATUS ?", "$TEMPS ?", "$SHOT ?", "$USHOT ?"]
+
+class LaserTelemetry:
+
+    # samples the Centurion status bytes, temperatures and shot counters every
+    # period with one pipelined exchange, appends them to a daily CSV file and
+    # publishes the latest sample in shared memory, so the forked run processes
+    # and the CLI check fire authorization and temperature limits without
+    # waiting on the serial line. Sampling pauses while the laser outlet is off,
+    # stale samples fall back to a direct query
+
+    def __init__(self, laser, period=TELEMETRY_PERIOD, path='logs/laser.csv'):
+        self.laser = laser
+        self.period = period
+        self.values = multiprocessing.Array('d', [math.nan] * len(TELEMETRY_FIELDS))
+        # samples, errors
+        self.counters = multiprocessing.Array('l', 2)
+        self.enabled = multiprocessing.Event()
+        self.enabled.set()
+        self.stopped = threading.Event()
+        self.thr = None
+
+        self.csv = logging.getLogger("csv_laser")
+        self.csv.setLevel(logging.INFO)
+        if not self.csv.handlers:
+            csv_formatter = logging.Formatter('%(asctime)s%(message)s', datefmt='%Y-%m-%d %H:%M:%S')
+            csv_handler = TimedRotatingFileHandler(path, when='midnight',
+                atTime=datetime.time(hour=18, minute=0))
+            csv_handler.setFormatter(csv_formatter)
+            self.csv.addHandler(csv_handler)
+
+    def start(self):
+        self.stopped.clear()
+        self.thr = threading.Thread(target=self.loop, daemon=True)
+        self.thr.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.thr is not None:
+            self.thr.join()
+
+    def power(self, state):
+        # laser outlet listener, nothing to sample while the laser is off
+        if state:
+            self.enabled.set()
+        else:
+            self.enabled.clear()
+            self.invalidate()
+
+    def invalidate(self):
+        with self.values.get_lock():
+            for i in range(len(self.values)):
+                self.values[i] = math.nan
+
+    def loop(self):
+        t = time.monotonic()
+        while not self.stopped.is_set():
+            if self.enabled.is_set():
+                self.sample()
+            t += self.period
+            delay = t - time.monotonic()
+            if delay < 0:
+                # sampling slower than the period, skip the missed slots
+                t = time.monotonic()
+                delay = 0
+            self.stopped.wait(delay)
+
+    @staticmethod
+    def parse(replies):
+        # sample as {field: value}, NaN for the missing or unparsable replies
+        sample = dict.fromkeys(TELEMETRY_FIELDS[1:], math.nan)
+        status, temps, shots, user_shots = [reply.split() if reply else [] for reply in replies]
+        try:
+            if len(status) == 6 and status[0] == '$STATUS':
+                for name, value in zip(TELEMETRY_FIELDS[1:6], status[1:]):
+                    sample[name] = int(value, 16)
+            if len(temps) == 4 and temps[0] == '$TEMPS':
+                for name, value in zip(TELEMETRY_FIELDS[6:9], temps[1:]):
+                    sample[name] = int(value)
+            if len(shots) == 2:
+                sample['shots'] = int(shots[1])
+            if len(user_shots) == 2:
+                sample['user_shots'] = int(user_shots[1])
+        except ValueError:
+            pass
+        return sample
+
+    def sample(self):
+        replies = self.laser.pipeline(TELEMETRY_QUERIES, TELEMETRY_REPLY_TIMEOUT)
+        if replies == -1 or not any(replies):
+            with self.counters.get_lock():
+                self.counters[1] += 1
+            self.invalidate()
+            return -1
+        sample = LaserTelemetry.parse(replies)
+        sample['time'] = time.time()
+        with self.values.get_lock():
+            for i, name in enumerate(TELEMETRY_FIELDS):
+                self.values[i] = sample[name]
+        with self.counters.get_lock():
+            self.counters[0] += 1
+            if not all(replies):
+                self.counters[1] += 1
+        self.csv.info(f",{int(sample['time'])}," + ",".join(
+            '' if math.isnan(sample[name]) else str(int(sample[name])) for name in TELEMETRY_FIELDS[1:]))
+        return 0
+
+    def latest(self, max_age=None):
+        # last sample, None if older than max_age (default a few periods)
+        if max_age is None:
+            max_age = TELEMETRY_MAX_AGE_PERIODS * self.period
+        with self.values.get_lock():
+            sample = dict(zip(TELEMETRY_FIELDS, self.values))
+        if math.isnan(sample['time']) or time.time() - sample['time'] > max_age:
+            return None
+        return sample
+
+    def stats(self):
+        sample = self.latest(math.inf)
+        return {'samples': self.counters[0], 'errors': self.counters[1],
+            'age': time.time() - sample['time'] if sample is not None else None}
+
+    @staticmethod
+    def field(sample, name):
+        # integer value of a sample field, None when missing (NaN)
+        value = sample[name] if sample is not None else math.nan
+        return None if math.isnan(value) else int(value)
+
+    def fire_auth(self):
+        state = LaserTelemetry.field(self.latest(), 'state')
+        if state is None:
+            return self.laser.fire_auth()
+        return state == 0x7E
+
+    def temperature(self):
+        sample = self.latest()
+        temps = tuple(LaserTelemetry.field(sample, name) for name in TELEMETRY_FIELDS[6:9])
+        if None in temps:
+            return self.laser.temperature()
+        return temps
+
+    def fire(self):
+        self.laser.fire(self.temperature())
@@ -0,0 +1,129 @@
+import time
+import itertools
+import threading
+
+PLANNER_EXACT_STATIONS = 7      # exhaustive ordering up to this many stations, nearest neighbour + 2-opt above
+
+class MotorPlanner:
+
+    # visits a set of stations ({motor name: absolute position}) in the order
+    # minimizing the motion time. Motors of one VXM move one after the other,
+    # different VXMs move concurrently, so a transition costs as much as its
+    # slowest controller. Start positions come from the position trackers,
+    # uncertain motors are charged a homing
+
+    def __init__(self, motors):
+        self.motors = motors
+
+    def controllers(self, names):
+        groups = {}
+        for name in names:
+            vxm = self.motors[name].vxm
+            groups.setdefault(id(vxm), (vxm, []))[1].append(name)
+        return list(groups.values())
+
+    def current(self):
+        return {name: motor.vxm.tracker.get(name) if motor.vxm.tracker is not None else None
+            for name, motor in self.motors.items()}
+
+    def move_time(self, name, start, target):
+        # VXM kinematic model, homing first when the start is unknown
+        id = self.motors[name].id
+        home = [f"I{id}M-0", f"I{id}M-0", f"IA{id}M-0"] if start is None else []
+        return self.motors[name].vxm.model({id: start}).run(home + [f"IA{id}M{target}"])
+
+    def transition(self, positions, station):
+        per_vxm = {}
+        for name, target in station.items():
+            key = id(self.motors[name].vxm)
+            per_vxm[key] = per_vxm.get(key, 0.0) + self.move_time(name, positions.get(name), target)
+        return max(per_vxm.values(), default=0.0)
+
+    def cost(self, order, stations, positions):
+        positions = dict(positions)
+        total = 0.0
+        for i in order:
+            total += self.transition(positions, stations[i])
+            positions.update(stations[i])
+        return total
+
+    def nearest(self, stations, positions):
+        positions = dict(positions)
+        left = list(range(len(stations)))
+        order = []
+        while left:
+            i = min(left, key=lambda i: self.transition(positions, stations[i]))
+            left.remove(i)
+            order.append(i)
+            positions.update(stations[i])
+        return order
+
+    def two_opt(self, order, stations, positions):
+        best = self.cost(order, stations, positions)
+        improved = True
+        while improved:
+            improved = False
+            for i in range(len(order) - 1):
+                for j in range(i + 2, len(order) + 1):
+                    candidate = order[:i] + order[i:j][::-1] + order[j:]
+                    cost = self.cost(candidate, stations, positions)
+                    if cost < best - 1e-9:
+                        order, best, improved = candidate, cost, True
+        return order
+
+    def plan(self, stations, keep_order=False):
+        # ordered stations and estimated motion time (s)
+        positions = self.current()
+        n = len(stations)
+        if keep_order or n < 2:
+            order = list(range(n))
+        elif n <= PLANNER_EXACT_STATIONS:
+            order = list(min(itertools.permutations(range(n)), key=lambda o: self.cost(o, stations, positions)))
+        else:
+            order = self.two_opt(self.nearest(stations, positions), stations, positions)
+        return [stations[i] for i in order], self.cost(order, stations, positions)
+
+    def move(self, station):
+        # one program per controller, controllers in parallel
+        groups = self.controllers(station)
+        results = {}
+        def execute(vxm, names):
+            results[id(vxm)] = -1
+            try:
+                program = vxm.program()
+                for name in names:
+                    program.home(name).move_abs(name, station[name])
+                results[id(vxm)] = program.execute()
+            except Exception as e:
+                print(f"PLANNER:ERROR:Unable to move {names}: {e}")
+
+        threads = [threading.Thread(target=execute, args=group) for group in groups]
+        for thr in threads:
+            thr.start()
+        for thr in threads:
+            thr.join()
+        # a controller without result failed as well
+        return -1 if any(results.get(id(vxm), -1) != 0 for vxm, _ in groups) else 0
+
+    def execute(self, stations, at=None, keep_order=False):
+        # visit the stations, at(station) is called once the motors are there
+        ordered, duration = self.plan(stations, keep_order)
+        print(f"PLANNER:{len(ordered)} stations, estimated motion time {duration:.1f} s")
+        t = time.monotonic()
+        for station in ordered:
+            if self.move(station) != 0:
+                print(f"PLANNER:ERROR:Unable to reach {station}")
+                return -1
+            if at is not None:
+                at(station)
+        print(f"PLANNER:Done in {time.monotonic() - t:.1f} s (estimated {duration:.1f} s)")
+        return 0
+
+    @staticmethod
+    def calib_stations(cfg, keys=('ecal_position', 'pcal_position')):
+        # one station per calibration position configured in motors.yml
+        return [{name: params[key] for name, params in cfg.motors.items() if key in params} for key in keys]
+
+    @staticmethod
+    def scan(name, positions):
+        return [{name: pos} for pos in positions]
@@ -0,0 +1,47 @@
+import os
+import yaml
+import multiprocessing
+
+class PositionTracker:
+
+    # absolute position of each motor (steps from the VXM zero) persisted in a
+    # yaml file, None when uncertain. The file is the shared state: every call
+    # reads it, updates are atomic replaces under a lock created before the
+    # run processes are forked
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = multiprocessing.Lock()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as f:
+                positions = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            positions = {}
+        except yaml.YAMLError as e:
+            print(f"POSITIONS:LOAD:ERROR:Unable to parse {self.path}: {e}")
+            positions = {}
+        return positions
+
+    def save(self, positions):
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w') as f:
+            yaml.safe_dump(positions, f)
+        os.replace(tmp, self.path)
+
+    def get(self, name):
+        return self.load().get(name)
+
+    def update(self, changes):
+        with self.lock:
+            positions = self.load()
+            positions.update(changes)
+            self.save(positions)
+
+    def invalidate(self, names=None):
+        with self.lock:
+            positions = self.load()
+            for name in (names if names is not None else list(positions)):
+                positions[name] = None
+            self.save(positions)
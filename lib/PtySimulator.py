@@ -0,0 +1,70 @@
+import os
+import pty
+import tty
+import select
+import threading
+
+class PtySimulator:
+
+    # pseudo-terminal stand-in for a serial instrument: drivers open self.port
+    # (or the optional symlink) as if it was the real device
+
+    def __init__(self, link=None, terminator=b'\r'):
+        self.link = link
+        self.terminator = terminator
+        self.master, self.slave = pty.openpty()
+        tty.setraw(self.master)
+        tty.setraw(self.slave)
+        self.port = os.ttyname(self.slave)
+        self.wlock = threading.Lock()
+        self.running = False
+        self.thr = None
+        self.buffer = b''
+
+        if self.link is not None:
+            if os.path.lexists(self.link):
+                os.unlink(self.link)
+            os.symlink(self.port, self.link)
+            self.port = self.link
+
+    def start(self):
+        self.running = True
+        self.thr = threading.Thread(target=self.loop, daemon=True)
+        self.thr.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thr is not None:
+            self.thr.join()
+        if self.link is not None and os.path.islink(self.link):
+            os.unlink(self.link)
+        os.close(self.master)
+        os.close(self.slave)
+
+    def write(self, data):
+        if isinstance(data, str):
+            data = data.encode()
+        with self.wlock:
+            os.write(self.master, data)
+
+    def loop(self):
+        while self.running:
+            r, _, _ = select.select([self.master], [], [], 0.1)
+            if not r:
+                continue
+            try:
+                data = os.read(self.master, 4096)
+            except OSError:
+                break
+            self.handle_bytes(data)
+
+    def handle_bytes(self, data):
+        # default framing: split the input stream on the command terminator
+        self.buffer += data
+        while self.terminator in self.buffer:
+            line, self.buffer = self.buffer.split(self.terminator, 1)
+            self.handle(line.decode(errors='ignore').strip())
+
+    def handle(self, line):
+        pass
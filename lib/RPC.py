@@ -5,6 +5,7 @@ class RPCDevice:
 
     def __init__(self, port, baudrate=9600, bytesize=8, parity='N', stopbits=1, timeout=2):
         self.outlets = {}
+        self.listeners = []
         self.port = port
         self.serial = None
         self.params = locals()
@@ -38,6 +39,14 @@ class RPCDevice:
     def get_outlet(self, name):
         return self.outlets[name]
 
+    def add_listener(self, func):
+        # func(state) is called after the outlet is switched on (True) or off (False)
+        self.listeners.append(func)
+
+    def notify(self, state):
+        for func in self.listeners:
+            func(state)
+
     @check_open
     def wait_prompt(self):
         self.serial.write("\n\r".encode())
@@ -66,6 +75,7 @@ class RPCDevice:
                         break
             self.serial.write(b"y\r")  # confirm command 
             if self.status() == 1:
+                self.notify(True)
                 return True
         print(f"RPC:ON:ERROR:Outlet {self.id} did not turn ON.")
         return False
@@ -86,6 +96,7 @@ class RPCDevice:
                         break
             self.serial.write(b"y\r")  # confirm command 
             if self.status() == 0:
+                self.notify(False)
                 return True
         print(f"RPC:ON:ERROR:Outlet {self.id} did not turn OFF.")
         return False
@@ -107,4 +118,5 @@ class RPCOutlet(RPCDevice):
     def __init__(self, serial, id):
         self.serial = serial
         self.id = id
+        self.listeners = []
 
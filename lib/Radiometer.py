@@ -1,6 +1,14 @@
+import math
+import time
 import serial
+import threading
+import multiprocessing
+import numpy as np
 
 RADIOMETER_WAIT = 2
+RADIOMETER_RING_SIZE = 4096     # samples kept by RadiometerReader
+# configuration kept by the radiometer until it is powered off
+RADIOMETER_SETTINGS = ['TG', 'SS', 'FA', 'EV', 'BS', 'RA', 'DU']
 
 class Radiometer:
 
@@ -13,6 +21,10 @@ class Radiometer:
         self.params.pop('port')
         self.params.pop('model')
         self.params.pop('self')
+        # last known value of RADIOMETER_SETTINGS in this power-on session (NaN
+        # unknown) and skipped/sent counters, shared with the forked run processes
+        self.session = multiprocessing.Array('d', [math.nan] * len(RADIOMETER_SETTINGS))
+        self.session_counters = multiprocessing.Array('l', 2)
 
         try:
             self.serial = serial.Serial(**self.params)
@@ -62,12 +74,103 @@ class Radiometer:
             print(f"RADM_MON_{self.model}:SET:Unable to read result {label} {value}: {e}")
             return None
 
-        if ret[0] != '?':
+        if ret and ret[0] != '?':
+            self.remember(label, value)
             return ret[1:]
         else:
             print(f"RADM_MON_{self.model}:SET:Unable to set {label} {value}")
             return None
 
+    @staticmethod
+    def setting(label):
+        label = label.lstrip('$').upper()
+        return RADIOMETER_SETTINGS.index(label) if label in RADIOMETER_SETTINGS else None
+
+    def remember(self, label, value):
+        idx = Radiometer.setting(label)
+        if idx is not None:
+            with self.session.get_lock():
+                self.session[idx] = float(value)
+
+    def invalidate(self, *args):
+        # radiometer outlet power cycled, the configuration is lost
+        with self.session.get_lock():
+            for i in range(len(self.session)):
+                self.session[i] = math.nan
+
+    def session_stats(self):
+        return {'skipped': self.session_counters[0], 'sent': self.session_counters[1]}
+
+    @check_open
+    def pipeline(self, commands):
+        # write all the commands at once and read the replies in order,
+        # None for the commands answered with '?' or not answered
+        if not commands:
+            return []
+        try:
+            self.flush_buffers()
+            self.serial.write("".join(f"{command}\r" for command in commands).encode())
+        except serial.SerialException as e:
+            print(f"RADM_MON_{self.model}:PIPELINE:Unable to send {commands}: {e}")
+            return [None] * len(commands)
+
+        replies = []
+        for command in commands:
+            try:
+                ret = self.serial.read_until("\r".encode())[:-1].decode(errors='ignore')
+            except serial.SerialException as e:
+                print(f"RADM_MON_{self.model}:PIPELINE:Unable to read result {command}: {e}")
+                ret = None
+            if ret and ret[0] != '?':
+                replies.append(ret)
+            else:
+                print(f"RADM_MON_{self.model}:PIPELINE:Unable to execute {command}")
+                replies.append(None)
+        return replies
+
+    def query_command(self, label):
+        return label
+
+    def query_value(self, ret):
+        return ret
+
+    def configure(self, settings, queries=()):
+        # apply the settings not already active in this power-on session, then
+        # the queries; returns the settings not acknowledged and the replies to
+        # the queries. One cached setting is read back with the changed ones: the
+        # radiometer may have been power cycled or reset unnoticed, then the
+        # snapshot is dropped and everything is sent again
+        with self.session.get_lock():
+            changed = {label: value for label, value in settings.items()
+                if self.session[Radiometer.setting(label)] != float(value)}
+        cached = [label for label in settings if label not in changed]
+        check = [self.query_command(cached[0])] if cached else []
+        # with a readback the queries (AD starts the stream) wait for its outcome
+        replies = self.pipeline(check + [f"{label} {value}" for label, value in changed.items()]
+            + ([] if check else list(queries)))
+
+        if check:
+            try:
+                confirmed = float(self.query_value(replies[0])) == float(settings[cached[0]])
+            except (TypeError, ValueError):
+                confirmed = False
+            if not confirmed:
+                print(f"RADM_MON_{self.model}:CONFIGURE:{cached[0]} is {replies[0]}, configuration lost")
+                self.invalidate()
+                return self.configure(settings, queries)
+            replies = replies[1:] + self.pipeline(list(queries))
+
+        with self.session.get_lock():
+            self.session_counters[0] += len(cached)
+            self.session_counters[1] += len(changed)
+        failed = []
+        for (label, value), ret in zip(changed.items(), replies):
+            if ret is not None:
+                self.remember(label, value)
+            else:
+                failed.append(label)
+        return failed, replies[len(changed):]
+
 
 class Radiometer3700(Radiometer):
 
@@ -115,24 +218,20 @@ class Radiometer3700(Radiometer):
         return None
 
     def setup(self):
+        failed = None
         try:
-            #self.flush_buffers()
-            self.set("TG", 3)
-            self.set("SS", 0)
-            self.set("FA", 1.00)
-            self.set("EV", 1)
-            self.set("BS", 0)
-            self.set("RA", 2)
-            self.get("AD")
+            failed, _ = self.configure({'TG': 3, 'SS': 0, 'FA': 1.00, 'EV': 1, 'BS': 0, 'RA': 2}, ['AD'])
         except Exception as e:
             print(f"RADM_MON_{self.model}:SET_UP:ERROR:Some problem occurred: {e}")
 
-        print(f"RADM_MON_{self.model}:SET_UP done")
-        self.ready = True
+        self.ready = failed == []
+        if self.ready:
+            print(f"RADM_MON_{self.model}:SET_UP done")
+        else:
+            print(f"RADM_MON_{self.model}:SET_UP:ERROR:Unable to set {failed}")
 
     def set_range(self, range):
-        self.flush_buffers()
-        self.set("RA", range)
+        self.configure({'RA': range})
 
     def read_power(self):
         if (self.ready == True):
@@ -149,6 +248,12 @@ class RadiometerOphir(Radiometer):
         self.params.pop('__class__')
         super().__init__(model="OPHIR", **self.params)
 
+    def query_command(self, label):
+        return f"{label} ?"
+
+    def query_value(self, ret):
+        return ret[1:] if ret and ret[0] == '*' else ret
+
     @Radiometer.check_open
     def get(self, label):
         try:
@@ -197,14 +302,17 @@ class RadiometerOphir(Radiometer):
             return -1
 
     def setup(self):
+        failed = None
         try:
-            self.flush_buffers()
-            self.set("DU", 1)
+            failed, _ = self.configure({'DU': 1})
         except Exception as e:
             print(f"RADM_MON_{self.model}:SET_UP:ERROR:Some problem occurred: {e}")
 
-        print(f"RADM_MON_{self.model}:SET_UP done")
-        self.ready = True
+        self.ready = failed == []
+        if self.ready:
+            print(f"RADM_MON_{self.model}:SET_UP done")
+        else:
+            print(f"RADM_MON_{self.model}:SET_UP:ERROR:Unable to set {failed}")
 
     def read_power(self):
         if (self.ready == True):
@@ -212,5 +320,97 @@ class RadiometerOphir(Radiometer):
             return self.serial.read_until("\r".encode())[:-1].decode(errors='ignore')
         else:
             print(f"RADM_MON_{self.model}:ERROR Radiometer not ready")
-    
 
+
+class RadiometerReader:
+
+    # background reader of the energy values streamed by a radiometer after
+    # setup(): every value is parsed and stored with its monotonic and wall
+    # clock reception time in a fixed size ring buffer. While running, the
+    # reader owns the serial port, so get/set must not be used concurrently
+
+    def __init__(self, radiometer, size=RADIOMETER_RING_SIZE):
+        self.radiometer = radiometer
+        self.size = size
+        self.ring = np.zeros((size, 3))     # mono, wall, energy
+        self.count = 0                      # samples written since start
+        self.cursor = 0                     # next sample returned by drain()/iteration
+        self.overflow = 0
+        self.parse_errors = 0
+        self.cond = threading.Condition()
+        self.running = False
+        self.thr = None
+
+    def start(self):
+        with self.cond:
+            self.count = self.cursor = self.overflow = self.parse_errors = 0
+        self.running = True
+        self.thr = threading.Thread(target=self.loop, daemon=True)
+        self.thr.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thr is not None:
+            self.thr.join()
+        with self.cond:
+            self.cond.notify_all()
+
+    @staticmethod
+    def parse(line):
+        # 3700 streams plain values, Ophir prefixes them with '*'
+        return float(line.strip().lstrip('*'))
+
+    def loop(self):
+        while self.running:
+            if not self.radiometer.is_ready():
+                time.sleep(0.1)
+                continue
+            try:
+                line = self.radiometer.read_power()
+            except serial.SerialException:
+                line = None
+            if not line or not line.strip():
+                # timeout
+                continue
+            mono, wall = time.monotonic(), time.time()
+            try:
+                energy = RadiometerReader.parse(line)
+            except ValueError:
+                self.parse_errors += 1
+                continue
+            with self.cond:
+                self.ring[self.count % self.size] = (mono, wall, energy)
+                self.count += 1
+                if self.count - self.cursor > self.size:
+                    self.overflow += self.count - self.cursor - self.size
+                    self.cursor = self.count - self.size
+                self.cond.notify_all()
+
+    def take_since(self, t):
+        # samples received after monotonic time t still in the ring buffer, non blocking
+        with self.cond:
+            ring = self.ring[np.arange(max(self.count - self.size, 0), self.count) % self.size]
+        return ring[ring[:, 0] > t]
+
+    def drain(self):
+        # samples not returned yet, non blocking
+        with self.cond:
+            idx = np.arange(self.cursor, self.count) % self.size
+            self.cursor = self.count
+            return self.ring[idx]
+
+    def __iter__(self):
+        # blocking iteration over new samples until stop()
+        while True:
+            with self.cond:
+                while self.cursor == self.count and self.running:
+                    self.cond.wait()
+                if self.cursor == self.count:
+                    return
+                sample = tuple(self.ring[self.cursor % self.size])
+                self.cursor += 1
+            yield sample
+
+    def stats(self):
+        return {'received': self.count, 'overflow': self.overflow, 'parse_errors': self.parse_errors}
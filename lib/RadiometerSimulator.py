@@ -0,0 +1,195 @@
+import os
+import sys
+import time
+import random
+import argparse
+import threading
+from collections import deque
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.PtySimulator import PtySimulator
+
+# identity answers of the info() queries
+RADSIM_INFO = {
+    '3700': {'ID': '3700 SIM', 'VR': 'V2.10', 'PA': 'J25LP-MB SIM', 'ST': '0'},
+    'OPHIR': {'$II': 'NOVA-II SIM 000000', '$HI': 'PE25-C SIM 000000', '$BC': '100'},
+}
+# commands starting/arming the energy stream
+RADSIM_STREAM = {'3700': 'AD', 'OPHIR': 'DU'}
+
+class RadiometerSimulator(PtySimulator):
+
+    # Molectron 3700 / Ophir stand-in: answers the commands sent by
+    # lib/Radiometer.py, '*' for accepted commands, '?' for unknown or failed
+    # ones, Ophir query replies are '*' prefixed. Once armed (AD on the 3700,
+    # DU 1 on the Ophir) one energy value is streamed per shot, `latency`
+    # seconds after it. Shots come from an FPGASimulator (shots_cnt) when
+    # given, otherwise free running at `rate`. error_rate, drop_rate and
+    # garbage_rate inject '?' replies, lost and unparsable readings
+
+    def __init__(self, model='3700', link=None, rate=10.0, fpga=None, latency=0.02, jitter=0.002,
+            energy=1.0, noise=0.02, reply_delay=0.01, error_rate=0.0, drop_rate=0.0, garbage_rate=0.0):
+        super().__init__(link=link, terminator=b'\r')
+        self.model = str.upper(model)
+        self.rate = rate
+        self.fpga = fpga
+        self.latency = latency
+        self.jitter = jitter
+        self.energy = energy
+        self.noise = noise
+        self.reply_delay = reply_delay
+        self.error_rate = error_rate
+        self.drop_rate = drop_rate
+        self.garbage_rate = garbage_rate
+        self.settings = {}
+        self.streaming = False
+        self.queue = deque()
+        self.cond = threading.Condition()
+        self.counters = {'commands': 0, 'errors': 0, 'shots': 0, 'emitted': 0, 'dropped': 0, 'garbage': 0}
+        self.threads = []
+
+    def start(self):
+        super().start()
+        self.threads = [threading.Thread(target=self.shoot, daemon=True),
+            threading.Thread(target=self.emit, daemon=True)]
+        for thr in self.threads:
+            thr.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        with self.cond:
+            self.cond.notify_all()
+        for thr in self.threads:
+            thr.join()
+        super().stop()
+
+    def power_cycle(self):
+        # configuration lost, stream stopped
+        with self.cond:
+            self.settings.clear()
+            self.streaming = False
+            self.queue.clear()
+
+    def stats(self):
+        return dict(self.counters)
+
+    def reply(self, value):
+        if self.model == 'OPHIR':
+            value = f"*{value}"
+        self.write(f"{value}\r")
+
+    def ack(self):
+        self.write("*\r")
+
+    def handle(self, line):
+        if not line:
+            return
+        self.counters['commands'] += 1
+        time.sleep(self.reply_delay)
+        parts = line.split()
+        label = str.upper(parts[0])
+        key = label.lstrip('$')
+        info = RADSIM_INFO[self.model]
+
+        if random.random() < self.error_rate:
+            self.counters['errors'] += 1
+            self.write("?\r")
+        elif len(parts) == 1 or parts[1] == '?':
+            # query
+            if label in info:
+                self.reply(info[label])
+            elif key in self.settings:
+                self.reply(self.settings[key])
+            elif label == RADSIM_STREAM[self.model]:
+                self.arm(True)
+                self.ack()
+            else:
+                self.counters['errors'] += 1
+                self.write("?\r")
+        elif len(parts) == 2 and key in ['TG', 'SS', 'FA', 'EV', 'BS', 'RA', 'DU']:
+            self.settings[key] = parts[1]
+            if key == RADSIM_STREAM[self.model]:
+                self.arm(parts[1] != '0')
+            self.ack()
+        else:
+            self.counters['errors'] += 1
+            self.write("?\r")
+
+    def arm(self, b):
+        with self.cond:
+            self.streaming = b
+
+    def shot(self):
+        # energy of one shot, sent latency later
+        self.counters['shots'] += 1
+        if not self.streaming:
+            return
+        due = time.monotonic() + max(self.latency + random.gauss(0, self.jitter), 0)
+        with self.cond:
+            self.queue.append((due, random.gauss(self.energy, self.noise * self.energy)))
+            self.cond.notify_all()
+
+    def shoot(self):
+        last = None
+        t = time.monotonic()
+        while self.running:
+            if self.fpga is not None:
+                n = self.fpga.get_register('shots_cnt')
+                if last is not None and n != last:
+                    for _ in range(max(n - last, 1)):
+                        self.shot()
+                last = n
+                time.sleep(0.001)
+            else:
+                t += 1 / self.rate
+                delay = t - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+                self.shot()
+
+    def emit(self):
+        while self.running:
+            with self.cond:
+                while self.running and not self.queue:
+                    self.cond.wait(0.1)
+                if not self.queue:
+                    continue
+                due, energy = self.queue[0]
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            with self.cond:
+                if not self.queue or self.queue[0][0] != due:
+                    continue
+                self.queue.popleft()
+            if random.random() < self.drop_rate:
+                self.counters['dropped'] += 1
+            elif random.random() < self.garbage_rate:
+                self.counters['garbage'] += 1
+                self.write("E#R\r")
+            else:
+                self.counters['emitted'] += 1
+                # 10-3 Joule unit
+                self.reply(f"{energy:.4E}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='3700/Ophir radiometer simulator')
+    parser.add_argument('--model', default='3700', choices=['3700', 'ophir'], help='radiometer model')
+    parser.add_argument('--link', default=None, help='symlink for the pty (e.g. /tmp/ttyr02)')
+    parser.add_argument('--rate', type=float, default=10.0, help='shot rate (Hz)')
+    parser.add_argument('--latency', type=float, default=0.02, help='energy reporting latency (s)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='probability of a ? reply')
+    parser.add_argument('--drop-rate', type=float, default=0.0, help='probability of a lost reading')
+    parser.add_argument('--garbage-rate', type=float, default=0.0, help='probability of an unparsable reading')
+    args = parser.parse_args()
+
+    sim = RadiometerSimulator(args.model, args.link, rate=args.rate, latency=args.latency,
+        error_rate=args.error_rate, drop_rate=args.drop_rate, garbage_rate=args.garbage_rate).start()
+    print(f"radiometer {sim.model}: {sim.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
+        print(sim.stats())
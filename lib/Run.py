@@ -7,6 +7,12 @@ from functools import partial
 from enum import Enum
 from logging.handlers import TimedRotatingFileHandler
 from lib.DeviceCollection import DeviceCollection
+from lib.FPGABroker import PRIORITY_URGENT
+from lib.ShotAcquisition import ShotAcquisition
+from lib.ShotArchive import ShotArchive
+from lib.ShotCorrelator import ShotCorrelator
+from lib.EventCapture import EventCapture
+from lib.TimingStats import TimingStats
 from lib.Helpers import *
 
 class RunType(Enum):
@@ -32,9 +38,38 @@ class RunBase:
             handler.setFormatter(formatter)
             self.logger.addHandler(handler)
         self.log = partial(self.logger.log, extra={'classname': self.__class__.__name__})
+        self.profile = {}
+        self.archive = None
+        self.timing = None
+        self.radiometers = {}
+
+    def open_archive(self, capacity, radiometers=()):
+        runtype = self.__class__.__name__[len('Run'):].lower()
+        path = ShotArchive.get_path(runtype, self.identity)
+        self.archive = ShotArchive(path, {
+            'runtype': runtype,
+            'identity': self.identity,
+            'start': datetime.datetime.now().isoformat(),
+            'profile': self.profile,
+            'latency': {name: self.dc.latency[name] for name in radiometers if name in self.dc.latency},
+        }, radiometers, capacity)
+        self.log(logging.INFO, f"shot archive {path}")
+        return self.archive
+
+    def close_archive(self):
+        if self.timing is not None:
+            level = logging.INFO if self.timing.report().get('status', 'ok') == 'ok' else logging.WARNING
+            self.log(level, f"trigger timing: {self.timing.summary()}")
+        if self.archive is not None:
+            if self.timing is not None:
+                self.archive.set_meta('timing', self.timing.report())
+            self.log(logging.INFO, f"shot archive closed, {self.archive.count} shots")
+            self.archive.close()
+            self.archive = None
 
     def execute(self, do_prepare=True, do_finish=True):
         ret = None
+        stats = self.dc.fpga.cache_stats()
         if do_prepare:
             try:
                 ret = self.prepare()
@@ -50,6 +85,9 @@ class RunBase:
                 self.finish()
             except Exception as e:
                 self.log(logging.ERROR, f"exception occurred during finish: {e}")
+        hits = self.dc.fpga.cache_stats()['hits'] - stats['hits']
+        misses = self.dc.fpga.cache_stats()['misses'] - stats['misses']
+        self.log(logging.INFO, f"FPGA register cache: {hits} hits ({hits} UART round trips saved), {misses} misses")
 
 
 class RunMock(RunBase):
@@ -78,22 +116,31 @@ class RunRaman(RunBase):
         super().__init__(dc, params)
 
         self.nshots = 75000
+        self.pulse_period = 1_000_000      # 10 ms
+        # stream the FPGA events (and radiometer) of every shot to the shot archive
+        self.capture = self.params[self.identity].get('raman_capture', False)
+        self.timing = TimingStats(0, self.pulse_period)
 
     def prepare(self):
         self.log(logging.INFO, "configure FPGA registers for RAMAN run")
-        self.dc.fpga.write_register('pps_delay', 0)
+        self.profile = {
+            'pps_delay': 0,
+            'pulse_width': 10_000,          # 100 us
+            'pulse_energy': 17_400,         # 140 us = 174 us, maximum
+            'pulse_period': self.pulse_period,
+            'shots_num': self.nshots,
+            'mux_bnc_0': 0b0010,
+            'mux_bnc_1': 0b0010,
+            'mux_bnc_2': 0b0010,
+            'mux_bnc_3': 0b0010,
+            'mux_bnc_4': 0b0010,
+        }
+        failed = self.dc.fpga.write_registers(self.profile)
+        if failed:
+            self.log(logging.ERROR, f"FPGA register readback mismatch {failed} - run interrupted")
+            return -1
         self.dc.fpga.write_bit('laser_en', 1)
         self.dc.fpga.write_bit('timestamp_en', 0)
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        self.dc.fpga.write_register('pulse_period', 1_000_000) # 10 ms
-        self.dc.fpga.write_register('shots_num', self.nshots)
-
-        self.dc.fpga.write_register('mux_bnc_0', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_1', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_2', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_3', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_4', 0b0010)
         self.log(logging.INFO, "done")
         
         self.log(logging.INFO, "turn on inverter")
@@ -135,12 +182,12 @@ class RunRaman(RunBase):
         self.log(logging.INFO, "done")
         
         self.log(logging.INFO, "laser setup")
-        self.dc.laser.set_mode(qson = 1, dpw = 140)
+        self.dc.laser.apply_profile('raman')
         self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "radiometer 3700 setup")
-        self.dc.get_radiometer('Rad1').setup()
-        self.log(logging.INFO, "done")
+        self.log(logging.INFO, "radiometers setup")
+        self.radiometers = self.dc.setup_radiometers()
+        self.log(logging.INFO, f"done {list(self.radiometers)}")
 
         self.log(logging.INFO, "select RAMAN beam")
         self.dc.fpga.write_dio('flipper_raman', True)
@@ -156,61 +203,74 @@ class RunRaman(RunBase):
 
         self.log(logging.INFO, "wait for cover opening...")
         cover_timeout_s = 120
-        t = 0
-        while self.dc.fpga.read_dio('cover_raman_open') == self.dc.fpga.read_dio('cover_raman_closed'):
-            if t >= cover_timeout_s:
-                self.log(logging.ERROR, f"cover open timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.watch(('cover_raman_open', 'cover_raman_closed'), lambda o, c: o != c, cover_timeout_s):
+            self.log(logging.ERROR, f"cover open timeout ({cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "laser warmup and wait for laser fire auth")
         self.dc.laser.warmup()
         laser_timeout_s = 120
         t = 0
-        while not self.dc.laser.fire_auth():
+        while not self.dc.telemetry.fire_auth():
             if t >= laser_timeout_s:
                 self.log(logging.ERROR, f"laser fire authorization timeout ({laser_timeout_s}s) - run interrupted")
                 return -1
-            self.log(logging.INFO, self.dc.laser.temperature())
+            self.log(logging.INFO, self.dc.telemetry.temperature())
             #self.dc.laser.standby()
             time.sleep(1)
             t += 1
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "set laser in fire mode...")
-        self.dc.laser.fire()
+        self.dc.telemetry.fire()
         self.log(logging.INFO, "done")
 
         return 0
 
     def run(self):
-        self.log(logging.INFO, "start laser shots")
-        self.dc.fpga.write_dio('laser_en', 1)
-        self.dc.fpga.write_dio('laser_start', 1)
+        capture = None
+        if self.capture:
+            self.log(logging.INFO, "start shot capture")
+            self.open_archive(self.nshots, list(self.radiometers))
+            self.dc.fpga.write_dio('timestamp_en', 1)
+            capture = EventCapture(self.dc.data, self.archive, self.pulse_period, self.radiometers, timing=self.timing,
+                log=lambda stats: self.log(logging.INFO, f"capture {stats}"), latency=self.dc.latency).start()
+            self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "start DAQ process on RAMAN PC")
-        hostname = "192.168.218.191"
-        username = "root"
-        password = "ariag25"
+        try:
+            self.log(logging.INFO, "start laser shots")
+            self.dc.fpga.write_dio('laser_en', 1)
+            self.dc.fpga.write_dio('laser_start', 1)
 
-        client = paramiko.SSHClient()
-        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-        client.connect(hostname, username=username, password=password, look_for_keys=False, allow_agent=False)
+            self.log(logging.INFO, "start DAQ process on RAMAN PC")
+            hostname = "192.168.218.191"
+            username = "root"
+            password = "ariag25"
 
-        stdin, stdout, stderr = client.exec_command("./start12 >& /media/data/rdata/start12.log & echo $!")
-        pid = stdout.read().decode().strip()
-        self.log(logging.INFO, "done")
+            client = paramiko.SSHClient()
+            client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            client.connect(hostname, username=username, password=password, look_for_keys=False, allow_agent=False)
 
-        self.log(logging.INFO, "wait for laser shots end")
-        while True:
-            ns = self.dc.fpga.read_register('shots_cnt')
-            if ns == self.nshots:
-                break
-            self.log(logging.INFO, f'shots: {ns}')
-            time.sleep(20)
-        self.log(logging.INFO, "done")
+            stdin, stdout, stderr = client.exec_command("./start12 >& /media/data/rdata/start12.log & echo $!")
+            pid = stdout.read().decode().strip()
+            self.log(logging.INFO, "done")
+
+            self.log(logging.INFO, "wait for laser shots end")
+            shots_eta = time.monotonic() + self.nshots * 0.01      # 10 ms pulse period
+            shots_timeout_s = self.nshots * 0.01 + 120
+            if not self.dc.fpga.watch('shots_cnt', lambda ns: ns >= self.nshots, shots_timeout_s, eta=shots_eta):
+                self.log(logging.ERROR, f"laser shots timeout ({shots_timeout_s}s), shots: {self.dc.fpga.read_register('shots_cnt')}")
+            self.log(logging.INFO, "done")
+        finally:
+            if capture is not None:
+                self.log(logging.INFO, "stop shot capture")
+                time.sleep(1)       # last packets still in flight
+                capture.stop()
+                self.dc.fpga.write_dio('timestamp_en', 0)
+                self.log(logging.INFO, f"capture {capture.stats()}")
+                self.close_archive()
+                self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "waiting for RAMAN DAQ process to finish...")
         while True:
@@ -236,25 +296,16 @@ class RunRaman(RunBase):
         self.log(logging.INFO, "done")
 
         cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait for open limit switch release")
-        while self.dc.fpga.read_dio('cover_raman_open') == True:
-            if t >= cover_timeout_s:
-                self.log(logging.ERROR, f"limit switch release timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.watch('cover_raman_open', lambda o: o == False, cover_timeout_s):
+            self.log(logging.ERROR, f"limit switch release timeout ({cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
-        cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait cover closing")
-        while self.dc.fpga.read_dio('cover_raman_open') == self.dc.fpga.read_dio('cover_raman_closed'):
-            if t >= laser_timeout_s:
-                self.log(logging.ERROR, f"cover close timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.watch(('cover_raman_open', 'cover_raman_closed'), lambda o, c: o != c, cover_timeout_s):
+            self.log(logging.ERROR, f"cover close timeout ({cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
         
         time.sleep(2)
@@ -284,7 +335,7 @@ class RunRaman(RunBase):
 
         self.log(logging.INFO, "abort")
         
-        self.dc.fpga.write_bit('laser_en', 0)
+        self.dc.fpga.write_bit('laser_en', 0, priority=PRIORITY_URGENT)
 
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
@@ -295,25 +346,16 @@ class RunRaman(RunBase):
         self.log(logging.INFO, "done")
 
         cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait for open limit switch release")
-        while self.dc.fpga.read_dio('cover_raman_open') == True:
-            if t >= cover_timeout_s:
-                self.log(logging.ERROR, f"limit switch release timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.watch('cover_raman_open', lambda o: o == False, cover_timeout_s):
+            self.log(logging.ERROR, f"limit switch release timeout ({cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
-        cover_timeout_s = 120
-        t = 0
         self.log(logging.INFO, "wait cover closing")
-        while self.dc.fpga.read_dio('cover_raman_open') == self.dc.fpga.read_dio('cover_raman_closed'):
-            if t >= laser_timeout_s:
-                self.log(logging.ERROR, f"cover close timeout ({cover_timeout_s}) - run interrupted")
-                return -1
-            time.sleep(1)
-            t += 1
+        if not self.dc.fpga.watch(('cover_raman_open', 'cover_raman_closed'), lambda o, c: o != c, cover_timeout_s):
+            self.log(logging.ERROR, f"cover close timeout ({cover_timeout_s}) - run interrupted")
+            return -1
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "unselect RAMAN beam")
@@ -328,25 +370,31 @@ class RunFD(RunBase):
     def __init__(self, dc : DeviceCollection, params):
         super().__init__(dc, params)
         self.nshots = 50
+        self.pulse_period = 100_000_000    # 1000 ms 1 hz
+        self.timing = TimingStats(self.params[self.identity]['fd_pps_delay'], self.pulse_period)
         
     def prepare(self):
         self.log(logging.INFO, "prepare")
         self.log(logging.INFO, "configure FPGA registers for FD run")
         value = self.params[self.identity]['fd_pps_delay']
-        self.dc.fpga.write_register('pps_delay', value) 
+        self.profile = {
+            'pps_delay': value,
+            'pulse_width': 10_000,          # 100 us
+            'pulse_energy': 17_400,         # 140 us = 174 us, maximum
+            'pulse_period': self.pulse_period,
+            'shots_num': self.nshots,
+            'mux_bnc_0': 0b0010,
+            'mux_bnc_1': 0b0010,
+            'mux_bnc_2': 0b0010,
+            'mux_bnc_3': 0b0010,
+            'mux_bnc_4': 0b0010,
+        }
+        failed = self.dc.fpga.write_registers(self.profile)
+        if failed:
+            self.log(logging.ERROR, f"FPGA register readback mismatch {failed} - run interrupted")
+            return -1
         self.dc.fpga.write_bit('laser_en', 1)
         self.dc.fpga.write_bit('timestamp_en', 0)
-
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        self.dc.fpga.write_register('pulse_period', 100_000_000)  # 1000 ms 1 hz
-        self.dc.fpga.write_register('shots_num', self.nshots)
-
-        self.dc.fpga.write_register('mux_bnc_0', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_1', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_2', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_3', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_4', 0b0010)
         self.log(logging.INFO, "done")
         
         self.log(logging.INFO, "turn on inverter")
@@ -387,23 +435,23 @@ class RunFD(RunBase):
             time.sleep(1)
         self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "radiometer 3700 setup")
-        self.dc.get_radiometer('Rad1').setup()
-        self.log(logging.INFO, "done")
+        self.log(logging.INFO, "radiometers setup")
+        self.radiometers = self.dc.setup_radiometers()
+        self.log(logging.INFO, f"done {list(self.radiometers)}")
         
         self.log(logging.INFO, "laser setup")
-        self.dc.laser.set_mode(qson = 1, dpw = 140)
+        self.dc.laser.apply_profile('fd')
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "laser warmup and wait for laser fire auth")
         self.dc.laser.warmup()
         laser_timeout_s = 120
         t = 0
-        while not self.dc.laser.fire_auth():
+        while not self.dc.telemetry.fire_auth():
             if t >= laser_timeout_s:
                 self.log(logging.ERROR, f"laser fire authorization timeout ({laser_timeout_s}s) - run interrupted")
                 return -1
-            self.log(logging.INFO, self.dc.laser.temperature())
+            self.log(logging.INFO, self.dc.telemetry.temperature())
             #self.dc.laser.standby()
             time.sleep(1)
             t += 1
@@ -425,7 +473,7 @@ class RunFD(RunBase):
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "set laser in fire mode...")
-        self.dc.laser.fire()
+        self.dc.telemetry.fire()
         self.log(logging.INFO, "done")
 
         return 0
@@ -433,12 +481,30 @@ class RunFD(RunBase):
     def run(self):
         self.log(logging.INFO, "start FD Run")
         self.dc.fpga.write_dio('laser_en', 1)
+        self.dc.data.reset()
+        self.open_archive(self.nshots, list(self.radiometers))
+        correlator = ShotCorrelator(self.pulse_period, list(self.radiometers), latency=self.dc.latency)
+        if correlator.ambiguous:
+            self.log(logging.WARNING, f"radiometer latency not calibrated within a pulse period {correlator.ambiguous} - shot pairing ambiguous")
+        self.archive.set_meta('ambiguous', correlator.ambiguous)
+        acq = ShotAcquisition(self.dc.data, self.radiometers, self.pulse_period).start()
         self.dc.fpga.write_dio('laser_start', 1)
 
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad1').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
+        try:
+            for shot in acq.shots(self.nshots, correlator):
+                power = {name: shot.power(name) for name in self.radiometers}
+                seconds, counter, pps, counter_cycles = shot.event_values()
+                self.log(logging.INFO, f'power {shot.index} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
+                self.archive.append_shot(shot)
+                if shot.event is not None:
+                    self.timing.update(counter, pps)
+                if not shot.complete():
+                    self.log(logging.WARNING, f"shot {shot.index} unmatched - event: {shot.event is not None}, power: {power}")
+        finally:
+            acq.stop()
+            self.close_archive()
+        self.log(logging.INFO, f"acquisition counters: {acq.stats()}")
+        self.log(logging.INFO, f"correlation counters: {correlator.stats()}")
         
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
@@ -475,7 +541,7 @@ class RunFD(RunBase):
     def abort(self):
         self.log(logging.INFO, "abort")
 
-        self.dc.fpga.write_dio('laser_en', 0)
+        self.dc.fpga.write_dio('laser_en', 0, priority=PRIORITY_URGENT)
 
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
@@ -498,25 +564,32 @@ class RunTank(RunBase):
     def __init__(self, dc : DeviceCollection, params):
         super().__init__(dc, params) 
         self.nshots = 3
+        self.pulse_period = 100_000_000    # 1000 ms 1 hz
+        self.timing = TimingStats(self.params[self.identity]['tank_pps_delay'], self.pulse_period)
         self.tankname = self.params[self.identity]['tank_name']
 
     def prepare(self):
         self.log(logging.INFO, "prepare")
         print("configure FPGA registers for TANK run ({self.tankname})...")
         value = self.params[self.identity]['tank_pps_delay']
-        self.dc.fpga.write_register('pps_delay', value) 
+        self.profile = {
+            'pps_delay': value,
+            'pulse_width': 10_000,          # 100 us
+            'pulse_energy': 17_400,         # 140 us = 174 us, maximum
+            #'pulse_period': 3_000_000_000, # 30_000 ms
+            'pulse_period': self.pulse_period,
+            'shots_num': self.nshots,
+            'mux_bnc_0': 0b0010,
+            'mux_bnc_1': 0b0010,
+            'mux_bnc_2': 0b0010,
+            'mux_bnc_3': 0b0010,
+            'mux_bnc_4': 0b0010,
+        }
+        failed = self.dc.fpga.write_registers(self.profile)
+        if failed:
+            self.log(logging.ERROR, f"FPGA register readback mismatch {failed} - run interrupted")
+            return -1
         self.dc.fpga.write_bit('laser_en', 1)
-        self.dc.fpga.write_register('pulse_width', 10_000)  # 100 us
-        self.dc.fpga.write_register('pulse_energy', 17_400) # 140 us = 174 us, maximum
-        #self.dc.fpga.write_register('pulse_period', 3_000_000_000) # 30_000 ms 
-        self.dc.fpga.write_register('pulse_period', 100_000_000)  # 1000 ms 1 hz
-        self.dc.fpga.write_register('shots_num', self.nshots)
-
-        self.dc.fpga.write_register('mux_bnc_0', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_1', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_2', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_3', 0b0010)
-        self.dc.fpga.write_register('mux_bnc_4', 0b0010)
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "turn on inverter")
@@ -557,23 +630,23 @@ class RunTank(RunBase):
             time.sleep(1)
         self.log(logging.INFO, "done")
 
-        self.log(logging.INFO, "radiometer 3700 setup")
-        self.dc.get_radiometer('Rad1').setup()
-        self.log(logging.INFO, "done")
+        self.log(logging.INFO, "radiometers setup")
+        self.radiometers = self.dc.setup_radiometers()
+        self.log(logging.INFO, f"done {list(self.radiometers)}")
 
         self.log(logging.INFO, "laser setup")
-        self.dc.laser.set_mode(qson = 1, dpw = 140)
+        self.dc.laser.apply_profile('tank')
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "laser warmup and wait for laser fire auth")
         self.dc.laser.warmup()
         laser_timeout_s = 120
         t = 0
-        while not self.dc.laser.fire_auth():
+        while not self.dc.telemetry.fire_auth():
             if t >= laser_timeout_s:
                 self.log(logging.ERROR, f"laser fire authorization timeout ({laser_timeout_s}s) - run interrupted")
                 return -1
-            self.log(logging.INFO, self.dc.laser.temperature())
+            self.log(logging.INFO, self.dc.telemetry.temperature())
             #self.dc.laser.standby()
             time.sleep(1)
             t += 1
@@ -595,7 +668,7 @@ class RunTank(RunBase):
         self.log(logging.INFO, "done")
 
         self.log(logging.INFO, "set laser in fire mode...")
-        self.dc.laser.fire()
+        self.dc.telemetry.fire()
         self.log(logging.INFO, "done")
 
         return 0
@@ -603,12 +676,30 @@ class RunTank(RunBase):
     def run(self):
         self.log(logging.INFO, f"start TANK Run ({self.tankname})")
         self.dc.fpga.write_dio('laser_en', 1)
+        self.dc.data.reset()
+        self.open_archive(self.nshots, list(self.radiometers))
+        correlator = ShotCorrelator(self.pulse_period, list(self.radiometers), latency=self.dc.latency)
+        if correlator.ambiguous:
+            self.log(logging.WARNING, f"radiometer latency not calibrated within a pulse period {correlator.ambiguous} - shot pairing ambiguous")
+        self.archive.set_meta('ambiguous', correlator.ambiguous)
+        acq = ShotAcquisition(self.dc.data, self.radiometers, self.pulse_period).start()
         self.dc.fpga.write_dio('laser_start', 1)
 
-        for i in range(self.nshots):
-            power=self.dc.get_radiometer('Rad1').read_power()
-            seconds, counter, pps, counter_cycles = self.dc.data.read_event()
-            self.log(logging.INFO, f'power {i} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
+        try:
+            for shot in acq.shots(self.nshots, correlator):
+                power = {name: shot.power(name) for name in self.radiometers}
+                seconds, counter, pps, counter_cycles = shot.event_values()
+                self.log(logging.INFO, f'power {shot.index} shot: {power}, seconds: {seconds}, counter: {counter}, pps distance: {pps}ns, counter cycle: {counter_cycles}')
+                self.archive.append_shot(shot)
+                if shot.event is not None:
+                    self.timing.update(counter, pps)
+                if not shot.complete():
+                    self.log(logging.WARNING, f"shot {shot.index} unmatched - event: {shot.event is not None}, power: {power}")
+        finally:
+            acq.stop()
+            self.close_archive()
+        self.log(logging.INFO, f"acquisition counters: {acq.stats()}")
+        self.log(logging.INFO, f"correlation counters: {correlator.stats()}")
 
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
@@ -644,7 +735,7 @@ class RunTank(RunBase):
     def abort(self):
         self.log(logging.INFO, "abort")
 
-        self.dc.fpga.write_dio('laser_en', 0)
+        self.dc.fpga.write_dio('laser_en', 0, priority=PRIORITY_URGENT)
 
         self.log(logging.INFO, "set laser standby")
         self.dc.laser.standby()
@@ -164,6 +164,13 @@ class RunManager:
         else:
             return "idle"
 
+    def timing_status(self):
+        # trigger timing of the current or last run, shared by the run process
+        if self.run is None or self.run.timing is None:
+            return "n/a"
+        state = "in progress" if self.job_is_running() else "last run"
+        return f"{self.runentry.runtype.name} ({state}): {self.run.timing.summary()}"
+
     def close(self):
         self.loop = False
         self.thr.join()
@@ -0,0 +1,169 @@
+import time
+import queue
+import threading
+from dataclasses import dataclass, field
+from lib.Radiometer import RadiometerReader
+
+ACQ_QUEUE_SIZE = 256        # samples kept per source, the oldest are dropped when full
+ACQ_SHOT_MARGIN = 1.5       # extra time after the nominal shot time before giving up on it (s)
+
+@dataclass
+class Sample:
+    mono: float             # time.monotonic() at reception
+    wall: float             # time.time() at reception
+    value: object
+
+@dataclass
+class ShotRecord:
+    index: int
+    event: Sample = None
+    powers: dict = field(default_factory=dict)
+    time: float = None      # GPS time of the shot (s), estimated when the event is missing
+
+    def complete(self):
+        return self.event is not None and None not in self.powers.values()
+
+    def power(self, name):
+        sample = self.powers.get(name, None)
+        return None if sample is None else sample.value
+
+    def energy(self, name):
+        try:
+            return float(self.power(name))
+        except (TypeError, ValueError):
+            return None
+
+    def event_values(self):
+        # same convention as FPGAData.read_event, zeros when the event is missing
+        return (0, 0, 0, 0) if self.event is None else self.event.value
+
+
+class SampleQueue:
+
+    # bounded queue fed by a producer thread, drops the oldest sample on overflow
+
+    def __init__(self, name, read, maxsize=ACQ_QUEUE_SIZE):
+        self.name = name
+        self.read = read
+        self.queue = queue.Queue(maxsize)
+        self.received = 0
+        self.dropped = 0
+        self.thr = None
+
+    def start(self, stopped):
+        self.thr = threading.Thread(target=self.loop, args=(stopped,), daemon=True)
+        self.thr.start()
+
+    def loop(self, stopped):
+        while not stopped.is_set():
+            try:
+                value = self.read()
+            except Exception:
+                value = None
+            if value is None:
+                # timeout or device not ready
+                stopped.wait(0.01)
+                continue
+            self.put(Sample(time.monotonic(), time.time(), value))
+
+    def put(self, sample):
+        self.received += 1
+        while True:
+            try:
+                self.queue.put_nowait(sample)
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def get(self, deadline):
+        try:
+            return self.queue.get(timeout=max(deadline - time.monotonic(), 0))
+        except queue.Empty:
+            return None
+
+    def drain(self):
+        ret = []
+        while True:
+            try:
+                ret.append(self.queue.get_nowait())
+            except queue.Empty:
+                return ret
+
+    def stats(self):
+        return {'received': self.received, 'dropped': self.dropped}
+
+
+class ShotAcquisition:
+
+    # FPGA events and radiometer readings are collected by one producer thread
+    # each and paired by a ShotCorrelator, the last deadline is derived from the
+    # FPGA pulse period so that missing replies never stall the run
+
+    def __init__(self, data, radiometers, pulse_period, margin=ACQ_SHOT_MARGIN):
+        self.period = pulse_period * 10e-9      # pulse_period register is in 10 ns ticks
+        self.margin = margin
+        self.stopped = threading.Event()
+        self.t0 = None
+        # shots correlated past nshots, not returned
+        self.extra_shots = 0
+
+        self.events = SampleQueue('fpga', lambda: self.read_event(data))
+        self.radiometers = {name: RadiometerReader(rad) for name, rad in radiometers.items()}
+
+    @staticmethod
+    def read_event(data):
+        event = data.read_event()
+        return None if event == (0, 0, 0, 0) else event
+
+    def start(self):
+        # call right before laser_start, shot deadlines are counted from here
+        self.stopped.clear()
+        self.t0 = time.monotonic()
+        self.events.start(self.stopped)
+        for reader in self.radiometers.values():
+            reader.start()
+        return self
+
+    def stop(self):
+        self.stopped.set()
+        if self.events.thr is not None:
+            self.events.thr.join()
+        for reader in self.radiometers.values():
+            reader.stop()
+
+    def deadline(self, index):
+        return self.t0 + (index + 1) * self.period + self.margin
+
+    def shots(self, nshots, correlator):
+        # feeds the ShotCorrelator with whatever the producers received and
+        # yields the correlated shots in order, shots still missing after the
+        # deadline of the last one are returned empty
+        index = 0
+        while index < nshots:
+            final = time.monotonic() > self.deadline(nshots - 1)
+            sample = self.events.get(min(time.monotonic() + self.period / 4, self.deadline(nshots - 1)))
+            for sample in ([sample] if sample else []) + self.events.drain():
+                correlator.add_event(sample)
+            for name, reader in self.radiometers.items():
+                for mono, wall, energy in reader.drain():
+                    correlator.add_sample(name, Sample(mono, wall, energy))
+            for shot in correlator.pop(time.time(), final):
+                if shot.index < nshots:
+                    index = shot.index + 1
+                    yield shot
+                else:
+                    self.extra_shots += 1
+            if final:
+                break
+        for i in range(index, nshots):
+            yield ShotRecord(i, None, {name: None for name in self.radiometers})
+
+    def stats(self):
+        ret = {'fpga': self.events.stats(), 'extra_shots': self.extra_shots}
+        for name, reader in self.radiometers.items():
+            ret[name] = reader.stats()
+        return ret
@@ -0,0 +1,144 @@
+import os
+import json
+import struct
+import datetime
+import numpy as np
+
+ARCHIVE_MAGIC = b'CLFSHOT1'
+ARCHIVE_HEADER_SIZE = 4096      # magic, count, capacity, then JSON metadata padded with spaces
+ARCHIVE_DIR = 'data'
+
+# per-shot columns, each radiometer adds its energy and receive time columns
+ARCHIVE_COLUMNS = [
+    ('shot', '<i4'),
+    ('seconds', '<u4'),
+    ('counter', '<i8'),
+    ('pps_delta', '<i4'),
+    ('counter_pulses', '<u2'),
+    ('host_time', '<f8'),
+]
+
+class ShotArchive:
+
+    # append-only columnar shot file: every column is a fixed-dtype array of
+    # `capacity` entries memory-mapped after the header, the number of valid
+    # rows is kept in the header and updated after each append
+
+    def __init__(self, path, meta, radiometers=(), capacity=1024):
+        self.path = path
+        self.columns = ARCHIVE_COLUMNS + [(f"{column}_{name}", '<f8') for name in radiometers for column in ['energy', 'rxtime']]
+        self.meta = dict(meta)
+        self.meta['columns'] = self.columns
+        self.count = 0
+        self.capacity = 0
+        self.mm = None
+        self.arrays = {}
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.grow(max(capacity, 1))
+
+    @staticmethod
+    def get_path(runtype, identity, when=None):
+        when = when or datetime.datetime.now()
+        return os.path.join(ARCHIVE_DIR, f"{runtype}_{identity}_{when.strftime('%Y%m%d_%H%M%S')}.shots")
+
+    @staticmethod
+    def layout(columns, capacity):
+        offset = ARCHIVE_HEADER_SIZE
+        ret = {}
+        for name, dtype in columns:
+            ret[name] = (np.dtype(dtype), offset)
+            offset += np.dtype(dtype).itemsize * capacity
+        return ret, offset
+
+    def grow(self, capacity):
+        # columns are contiguous blocks, so a larger capacity means a new file:
+        # it is filled aside and renamed over the archive, which stays complete
+        # on disk until then
+        layout, size = ShotArchive.layout(self.columns, capacity)
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'wb') as f:
+            f.truncate(size)
+        mm = np.memmap(tmp, dtype=np.uint8, mode='r+', shape=(size,))
+        arrays = {name: np.ndarray(capacity, dtype, buffer=mm, offset=offset)
+            for name, (dtype, offset) in layout.items()}
+        for name, a in self.arrays.items():
+            arrays[name][:self.count] = a[:self.count]
+        self.close()
+        self.mm, self.arrays, self.capacity = mm, arrays, capacity
+        self.write_header()
+        self.flush()
+        os.replace(tmp, self.path)
+
+    def write_header(self):
+        meta = json.dumps(self.meta).encode()
+        if len(meta) > ARCHIVE_HEADER_SIZE - 24:
+            raise ValueError(f"Class ShotArchive - metadata too large ({len(meta)} bytes)")
+        header = ARCHIVE_MAGIC + struct.pack('<QQ', self.count, self.capacity) + meta.ljust(ARCHIVE_HEADER_SIZE - 24)
+        self.mm[:ARCHIVE_HEADER_SIZE] = np.frombuffer(header, dtype=np.uint8)
+
+    def set_meta(self, key, value):
+        self.meta[key] = value
+        self.write_header()
+
+    def append(self, **values):
+        if self.count == self.capacity:
+            self.grow(self.capacity * 2)
+        for name, dtype in self.columns:
+            default = np.nan if np.dtype(dtype).kind == 'f' else 0
+            value = values.get(name, None)
+            self.arrays[name][self.count] = default if value is None else value
+        self.count += 1
+        # row count last, a crash never exposes a half written row
+        self.mm[8:16] = np.frombuffer(struct.pack('<Q', self.count), dtype=np.uint8)
+
+    def extend(self, **columns):
+        # vectorized append of equally long arrays, missing columns are stored as 0/NaN
+        n = max(len(np.atleast_1d(v)) for v in columns.values())
+        capacity = self.capacity
+        while self.count + n > capacity:
+            capacity *= 2
+        if capacity != self.capacity:
+            self.grow(capacity)
+        for name, dtype in self.columns:
+            default = np.nan if np.dtype(dtype).kind == 'f' else 0
+            value = columns.get(name, None)
+            self.arrays[name][self.count:self.count + n] = default if value is None else value
+        self.count += n
+        self.mm[8:16] = np.frombuffer(struct.pack('<Q', self.count), dtype=np.uint8)
+
+    def set_column(self, name, values):
+        # fill a column of the rows already written (e.g. energies correlated after the run)
+        self.arrays[name][:self.count] = values
+
+    def append_shot(self, shot):
+        # ShotRecord from ShotAcquisition, missing values are stored as 0/NaN
+        seconds, counter, pps_delta, counter_pulses = shot.event_values()
+        values = {f"energy_{name}": shot.energy(name) for name in shot.powers}
+        values.update({f"rxtime_{name}": sample.wall for name, sample in shot.powers.items() if sample is not None})
+        self.append(shot=shot.index, seconds=seconds, counter=counter, pps_delta=pps_delta,
+            counter_pulses=counter_pulses, host_time=shot.event.wall if shot.event else None, **values)
+
+    def flush(self):
+        if self.mm is not None:
+            self.mm.flush()
+
+    def close(self):
+        if self.mm is not None:
+            self.flush()
+            self.arrays = {}
+            self.mm = None
+
+    @staticmethod
+    def load(path):
+        # read only view: returns the metadata and one array per column
+        with open(path, 'rb') as f:
+            header = f.read(ARCHIVE_HEADER_SIZE)
+        if header[:8] != ARCHIVE_MAGIC:
+            raise ValueError(f"Class ShotArchive - {path} is not a shot archive")
+        count, capacity = struct.unpack('<QQ', header[8:24])
+        meta = json.loads(header[24:].decode().rstrip())
+        layout, _ = ShotArchive.layout(meta['columns'], capacity)
+        mm = np.memmap(path, dtype=np.uint8, mode='r')
+        return meta, {name: np.ndarray(count, dtype, buffer=mm, offset=offset)
+            for name, (dtype, offset) in layout.items()}
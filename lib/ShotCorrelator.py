@@ -0,0 +1,221 @@
+import statistics
+import numpy as np
+from collections import deque
+from lib.ShotAcquisition import ShotRecord
+from lib.ShotArchive import ShotArchive
+
+CORR_LATENCY_SAMPLES = 50      # matched samples used for the radiometer latency estimate
+CORR_MAX_LATENCY = 0.5         # latency bound for a radiometer without calibrated latency (s)
+CORR_LATENCY_ERROR = 0.002     # uncertainty of a calibrated latency when not given (s)
+CORR_MAX_LEADING_LOST = 16     # first counter_pulses up to 1 + this are leading lost events, else the count is free running
+
+def shot_time(seconds, counter):
+    # GPS time of the shot: PPS second plus the counter (ns after the PPS)
+    return seconds + counter * 1e-9
+
+class ShotCorrelator:
+
+    # matches radiometer samples to FPGA shots by time instead of by loop index:
+    # the host clock offset is the minimum of (host receive time - GPS shot time)
+    # over the events, each radiometer sample is assigned to the shot expected
+    # within +-window once its own reporting latency is removed. Shots missing
+    # from the FPGA stream are inferred from counter_pulses and pulse_period.
+    # The latency starts from the calibrated {name: (nominal, error)} and is
+    # tracked as the median of the matched samples. A radiometer without
+    # calibration, or whose error spans a pulse period, is ambiguous: its
+    # samples may land a whole period off, the first one is anchored on the
+    # first shot
+
+    def __init__(self, pulse_period, radiometers, window=None, latency=None):
+        self.period = pulse_period * 10e-9      # pulse_period register is in 10 ns ticks
+        self.window = window if window is not None else self.period / 2
+        self.names = list(radiometers)
+        self.offset = None
+        self.latency = {name: deque(maxlen=CORR_LATENCY_SAMPLES) for name in self.names}
+        self.ambiguous = []
+        for name in self.names:
+            nominal, error = (latency or {}).get(name, (None, None))
+            if nominal is not None:
+                self.latency[name].append(nominal)
+            if ShotCorrelator.is_ambiguous(self.period, nominal, error):
+                self.ambiguous.append(name)
+        self.samples = {name: deque() for name in self.names}
+        self.pending = deque()
+        self.last_pulses = None
+        self.first_pulses = None
+        self.index = -1
+        self.unmatched_samples = {name: 0 for name in self.names}
+        self.unmatched_shots = 0
+        self.missing_events = 0
+
+    def new_shot(self, event, time):
+        self.index += 1
+        shot = ShotRecord(self.index, event, {name: None for name in self.names}, time)
+        self.pending.append(shot)
+        return shot
+
+    def add_event(self, sample):
+        seconds, counter, _, pulses = sample.value
+        t = shot_time(seconds, counter)
+        self.offset = sample.wall - t if self.offset is None else min(self.offset, sample.wall - t)
+
+        if self.last_pulses is None:
+            # counter_pulses restarts at 1 with the capture, the events lost
+            # before the first one are missing shots; any other value means a
+            # free running counter, the first event is then shot 0
+            self.first_pulses = pulses
+            lost = pulses - 1 if 0 <= pulses - 1 <= CORR_MAX_LEADING_LOST else 0
+            for k in range(lost, 0, -1):
+                self.missing_events += 1
+                self.new_shot(None, t - k * self.period)
+        else:
+            diff = (pulses - self.last_pulses) & 0xFFFF
+            if diff == 0 or diff >= 0x8000:
+                # repeated or out of order packet
+                return
+            for k in range(diff - 1, 0, -1):
+                self.missing_events += 1
+                self.new_shot(None, t - k * self.period)
+        self.last_pulses = pulses
+        self.new_shot(sample, t)
+
+    def add_sample(self, name, sample):
+        self.samples[name].append(sample)
+
+    @staticmethod
+    def is_ambiguous(period, nominal, error):
+        # more than one whole-period latency fits nominal +- error
+        return nominal is None or 2 * (error if error is not None else CORR_LATENCY_ERROR) >= period
+
+    def get_latency(self, name):
+        return statistics.median(self.latency[name]) if self.latency[name] else None
+
+    def match(self, shot):
+        t = shot.time + self.offset
+        for name in self.names:
+            if shot.powers[name] is not None:
+                continue
+            latency = self.get_latency(name)
+            # without calibration the first sample belongs to this shot, when
+            # not later than CORR_MAX_LATENCY
+            late = self.window if latency is not None else CORR_MAX_LATENCY
+            latency = latency or 0
+            q = self.samples[name]
+            while q and q[0].wall - latency < t - self.window:
+                q.popleft()
+                self.unmatched_samples[name] += 1
+            if q and q[0].wall - latency <= t + late:
+                sample = q.popleft()
+                shot.powers[name] = sample
+                self.latency[name].append(sample.wall - t)
+
+    def expired(self, shot, now):
+        # a silent radiometer has no estimate, it must not hold the shots
+        latency = max([self.get_latency(name) if self.get_latency(name) is not None else CORR_MAX_LATENCY
+            for name in self.names], default=0)
+        return now > shot.time + self.offset + latency + self.window
+
+    def pop(self, now=None, final=False):
+        # shots in order, each one as soon as all its samples are matched or
+        # its window has closed (`now` is host wall time)
+        ret = []
+        while self.pending:
+            shot = self.pending[0]
+            self.match(shot)
+            done = all(s is not None for s in shot.powers.values())
+            if not done and not final and (now is None or not self.expired(shot, now)):
+                break
+            self.pending.popleft()
+            if not done:
+                self.unmatched_shots += 1
+            ret.append(shot)
+        return ret
+
+    def stats(self):
+        return {'unmatched_shots': self.unmatched_shots, 'missing_events': self.missing_events,
+            'first_pulses': self.first_pulses, 'ambiguous': list(self.ambiguous),
+            'unmatched_samples': dict(self.unmatched_samples),
+            'latency': {name: self.get_latency(name) for name in self.names}}
+
+    @staticmethod
+    def nearest(t, x, window):
+        # index of the shot closest to each sample time x, the closest sample
+        # wins when several fall on the same shot; returns (shots, samples)
+        if len(t) > 1:
+            j = np.clip(np.searchsorted(t, x), 1, len(t) - 1)
+            j = np.where(np.abs(x - t[j - 1]) <= np.abs(x - t[j]), j - 1, j)
+        else:
+            j = np.zeros(len(x), dtype=int)
+        dist = np.abs(x - t[j])
+        i = np.flatnonzero(dist <= window)
+        i = i[np.lexsort((dist[i], j[i]))]
+        first = np.ones(len(i), dtype=bool)
+        first[1:] = j[i][1:] != j[i][:-1]
+        return j[i][first], i[first]
+
+    @staticmethod
+    def correlate(pulse_period, host_time, seconds, counter, samples, window=None, latency=None):
+        # bulk version on whole arrays: samples is {name: (host_time, values)},
+        # latency the calibrated {name: (nominal, error)}; returns {name: values
+        # per shot} with NaN for unmatched shots, and under 'ambiguous' the
+        # names whose latency was not pinned to one whole period
+        period = pulse_period * 10e-9
+        window = window if window is not None else period / 2
+        t = shot_time(np.asarray(seconds, dtype=np.float64), np.asarray(counter, dtype=np.float64))
+        order = np.argsort(t)
+        t = t[order]
+        ret = {'ambiguous': []}
+        if len(t) == 0:
+            ret.update({name: np.zeros(0) for name in samples})
+            return ret
+        t = t + np.min(np.asarray(host_time)[order] - t)
+
+        for name, (rx, values) in samples.items():
+            rx = np.asarray(rx, dtype=np.float64)
+            values = np.asarray(values, dtype=np.float64)
+            ok = ~np.isnan(rx)
+            rx, values = rx[ok], values[ok]
+            out = np.full(len(t), np.nan)
+            if len(rx) == 0:
+                ret[name] = out
+                continue
+
+            # latency modulo the period from the circular mean of the sample
+            # phases, then the whole periods allowed by the calibration (or up
+            # to CORR_MAX_LATENCY): the count matching most samples wins
+            phase = np.exp(2j * np.pi * (rx - t[0]) / period)
+            residue = (np.angle(phase.mean()) / (2 * np.pi) * period) % period
+            nominal, error = (latency or {}).get(name, (None, None))
+            if nominal is None:
+                lo, hi = 0, CORR_MAX_LATENCY
+            else:
+                error = error if error is not None else CORR_LATENCY_ERROR
+                lo, hi = nominal - error, nominal + error
+            periods = np.arange(np.ceil((lo - residue) / period), np.floor((hi - residue) / period) + 1)
+            if len(periods) == 0:
+                periods = np.round([((lo + hi) / 2 - residue) / period])
+            if ShotCorrelator.is_ambiguous(period, nominal, error) or len(periods) > 1:
+                ret['ambiguous'].append(name)
+            best = None
+            for n in periods:
+                match = ShotCorrelator.nearest(t, rx - residue - n * period, window)
+                if best is None or len(match[0]) > len(best[0]):
+                    best = match
+            out[best[0]] = values[best[1]]
+
+            ret[name] = np.empty(len(t))
+            ret[name][order] = out
+        return ret
+
+    @staticmethod
+    def correlate_archive(path):
+        # re-pair the radiometer samples of a shot archive by time
+        meta, columns = ShotArchive.load(path)
+        valid = columns['host_time'] == columns['host_time']
+        names = [name[len('energy_'):] for name, _ in meta['columns'] if name.startswith('energy_')]
+        samples = {name: (columns[f"rxtime_{name}"], columns[f"energy_{name}"]) for name in names}
+        latency = {name: tuple(value) for name, value in meta.get('latency', {}).items()}
+        ret = ShotCorrelator.correlate(meta['profile']['pulse_period'], columns['host_time'][valid],
+            columns['seconds'][valid], columns['counter'][valid], samples, latency=latency)
+        ret['shot'] = columns['shot'][valid]
+        return meta, ret
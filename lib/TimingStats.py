@@ -0,0 +1,99 @@
+import math
+import multiprocessing
+import numpy as np
+
+TIMING_HIST_BINS = 20           # histogram bins of the shot time error
+TIMING_HIST_WIDTH = 10          # bin width (ns), one FPGA clock tick
+TIMING_TOLERANCE = 200          # |mean error| above this is reported as drift (ns)
+
+# layout of the shared array: two Welford accumulators (n, mean, M2, min, max)
+# for the shot time error and pps_delta, then the histogram with under/overflow
+DELAY, PPS, HIST = 0, 5, 10
+
+class TimingStats:
+
+    # streaming statistics of the shot time relative to the GPS second: the
+    # error is the FPGA counter minus the expected pps_delay (modulo the pulse
+    # period for runs faster than 1 Hz). Values live in a multiprocessing.Array
+    # so the RunManager sees what the run process accumulates, create it before
+    # the run process is forked
+
+    def __init__(self, pps_delay, pulse_period):
+        self.expected = pps_delay * 10                          # ns after the PPS
+        self.modulus = min(pulse_period * 10, 1_000_000_000)    # ns
+        self.values = multiprocessing.Array('d', HIST + TIMING_HIST_BINS + 2)
+        self.reset()
+
+    def reset(self):
+        with self.values.get_lock():
+            for i in range(len(self.values)):
+                self.values[i] = 0
+            for base in (DELAY, PPS):
+                self.values[base + 3] = math.inf
+                self.values[base + 4] = -math.inf
+
+    def error(self, counter):
+        half = self.modulus // 2
+        return (np.asarray(counter, dtype=np.int64) - self.expected + half) % self.modulus - half
+
+    def merge(self, base, x):
+        # Chan et al. combination of the running moments with a batch
+        v = self.values
+        n = len(x)
+        mean = float(np.mean(x))
+        m2 = float(np.sum((x - mean) ** 2))
+        total = v[base] + n
+        delta = mean - v[base + 1]
+        v[base + 1] += delta * n / total
+        v[base + 2] += m2 + delta ** 2 * v[base] * n / total
+        v[base] = total
+        v[base + 3] = min(v[base + 3], float(np.min(x)))
+        v[base + 4] = max(v[base + 4], float(np.max(x)))
+
+    def update(self, counter, pps_delta):
+        # single shot or numpy batch from FPGAData.read_batch
+        err = np.atleast_1d(self.error(counter)).astype(np.float64)
+        pps = np.atleast_1d(np.asarray(pps_delta, dtype=np.float64))
+        if len(err) == 0:
+            return
+        bins = np.floor(err / TIMING_HIST_WIDTH).astype(np.int64) + TIMING_HIST_BINS // 2
+        hist = np.bincount(np.clip(bins + 1, 0, TIMING_HIST_BINS + 1), minlength=TIMING_HIST_BINS + 2)
+        with self.values.get_lock():
+            self.merge(DELAY, err)
+            self.merge(PPS, pps)
+            for i in np.flatnonzero(hist):
+                self.values[HIST + i] += hist[i]
+
+    def moments(self, base):
+        n, mean, m2, vmin, vmax = self.values[base:base + 5]
+        std = math.sqrt(m2 / (n - 1)) if n > 1 else 0.0
+        return int(n), mean, std, vmin, vmax
+
+    def report(self):
+        with self.values.get_lock():
+            n, mean, std, vmin, vmax = self.moments(DELAY)
+            _, pps_mean, pps_std, _, _ = self.moments(PPS)
+            hist = [int(h) for h in self.values[HIST:]]
+        if n == 0:
+            return {'shots': 0, 'expected_ns': self.expected}
+        return {
+            'shots': n,
+            'expected_ns': self.expected,
+            'mean_ns': round(mean, 1),
+            'rms_ns': round(math.sqrt(mean ** 2 + std ** 2), 1),
+            'std_ns': round(std, 1),
+            'min_ns': vmin,
+            'max_ns': vmax,
+            'pps_delta_mean_ns': round(pps_mean, 1),
+            'pps_delta_std_ns': round(pps_std, 1),
+            # bin i covers [(i - BINS/2) * WIDTH, (i - BINS/2 + 1) * WIDTH), plus underflow/overflow
+            'hist': hist,
+            'status': 'ok' if abs(mean) <= TIMING_TOLERANCE else 'drift',
+        }
+
+    def summary(self):
+        r = self.report()
+        if r['shots'] == 0:
+            return "no shots"
+        return (f"{r['shots']} shots, delay error mean {r['mean_ns']} ns, rms {r['rms_ns']} ns, "
+            f"min/max {r['min_ns']:.0f}/{r['max_ns']:.0f} ns, pps_delta {r['pps_delta_mean_ns']} +- {r['pps_delta_std_ns']} ns - {r['status']}")
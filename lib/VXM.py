@@ -1,9 +1,102 @@
+import re
+import math
 import serial
 import time
 
 VXM_COMMAND = 255
 VXM_RETURN = 50
 VMX_WAIT = 800000
+VXM_DEFAULT_ACC = 2000          # steps/s^2, controller power-on acceleration
+VXM_TRAVEL = 40000              # steps between the limit switches of motors 3-4, not measured (lmtx/lmty for 1-2)
+VXM_POLL_TIMEOUT = 0.02         # serial timeout while waiting for '^' (s)
+VXM_TIMEOUT_FACTOR = 2          # completion timeout = factor * expected duration + margin
+VXM_TIMEOUT_MARGIN = 2          # s
+VXM_LATENCY_BINS = [0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10, 30, 60]     # upper edges (s)
+
+def move_duration(steps, speed, acc):
+    # trapezoidal velocity profile, triangular when the speed is not reached
+    steps = abs(steps)
+    if steps * acc >= speed ** 2:
+        return steps / speed + speed / acc
+    return 2 * math.sqrt(steps / acc)
+
+def move_position(steps, speed, acc, t):
+    # distance covered t seconds after the start of a move of `steps`
+    steps = abs(steps)
+    total = move_duration(steps, speed, acc)
+    if t >= total:
+        return steps
+    peak = min(speed, math.sqrt(steps * acc))
+    ramp = peak / acc
+    if t < ramp:
+        return 0.5 * acc * t ** 2
+    if t > total - ramp:
+        return steps - 0.5 * acc * (total - t) ** 2
+    return 0.5 * acc * ramp ** 2 + peak * (t - ramp)
+
+class VXMModel:
+
+    # trapezoidal kinematics of the motors of one controller. Positions are
+    # in the absolute frame of the controller, lo is the negative limit switch
+    # and lo + travel the positive one, None when unknown: as an estimator an
+    # unknown distance counts as a full travel, VXMSimulator knows everything
+
+    def __init__(self, travel, speed, acc=None):
+        self.travel = dict(travel)
+        self.speed = dict(speed)
+        self.acc = dict(acc or {})
+        self.pos = {}
+        self.lo = {}
+        self.at_lo = set()
+
+    def execute(self, command):
+        # apply a program command, returns (motor index, start, end, duration)
+        m = re.fullmatch(r"(S|A|IA|I)(\d)M(-?\d+)|P(\d+)", command)
+        if m is None:
+            return None, None, None, 0.0
+        if m.group(4) is not None:
+            return None, None, None, int(m.group(4)) / 10
+        op, id, value = m.group(1), int(m.group(2)), m.group(3)
+        if op == 'S':
+            self.speed[id] = int(value)
+            return None, None, None, 0.0
+        if op == 'A':
+            self.acc[id] = int(value)
+            return None, None, None, 0.0
+
+        pos, lo, travel = self.pos.get(id), self.lo.get(id), self.travel[id]
+        if op == 'IA' and value == '-0':
+            # absolute zero at the current position
+            if pos is not None and lo is not None:
+                self.lo[id] = lo - pos
+            else:
+                self.lo[id] = 0 if id in self.at_lo else None
+            self.pos[id] = 0
+            return id, 0, 0, 0.0
+
+        if op == 'I' and value == '-0':
+            target, distance = lo, 0 if id in self.at_lo else travel
+        elif op == 'I' and value == '0':
+            target, distance = lo + travel if lo is not None else None, travel
+        elif op == 'IA':
+            target, distance = int(value), travel
+        else:
+            target, distance = pos + int(value) if pos is not None else None, min(abs(int(value)), travel)
+        if target is not None and lo is not None:
+            target = min(max(target, lo), lo + travel)
+        if target is not None and pos is not None:
+            distance = abs(target - pos)
+
+        self.pos[id] = target
+        if op == 'I' and value == '-0':
+            self.at_lo.add(id)
+        elif distance > 0:
+            self.at_lo.discard(id)
+        acc = self.acc.get(id, VXM_DEFAULT_ACC)
+        return id, pos, target, move_duration(distance, self.speed[id], acc) if distance else 0.0
+
+    def run(self, commands):
+        return sum(self.execute(command)[3] for command in commands)
 
 class VXM:
 
@@ -39,6 +132,19 @@ class VXM:
 
         self.serial.port = port
 
+        # speed and acceleration of each motor index, as last sent
+        self.speeds = {}
+        self.accs = {}
+        # completion latency (R to '^') histogram
+        self.latency_hist = [0] * (len(VXM_LATENCY_BINS) + 1)
+        self.latency_count = 0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.timeouts = 0
+        # motor index -> name, PositionTracker set by DeviceCollection
+        self.names = {}
+        self.tracker = None
+
     def open(self):
         try:
             self.serial.open()
@@ -46,17 +152,239 @@ class VXM:
             print(f"VXM:CONN: Unable to open device {self.port}: {e}")
 
     def add_motor(self, id, name):
-        self.motors[name] = self.Motor(self.serial, id)
+        self.motors[name] = self.Motor(self.serial, id, self)
+        self.names[id] = name
         return self.motors[name]
 
     def get_motor(self, name):
         return self.motors[name]
 
+    def program(self):
+        return VXM.Program(self)
+
+    def execute(self, program, timeout=None):
+        # upload the whole program and run it with a single R: one completion
+        # ('^') for the sequence instead of one per command
+        if not program.commands:
+            return 0
+        try:
+            if self.serial.is_open is False:
+                self.serial.open()
+            self.serial.reset_input_buffer()
+            self.serial.reset_output_buffer()
+            self.serial.write(f"C,{program.compile()},R".encode())
+        except serial.SerialException as e:
+            print(f"VXM:EXECUTE:ERROR:Unable to send program {program}: {e}")
+            self.commit(program.commands, False)
+            return -1
+
+        t = time.monotonic()
+        timeout = timeout if timeout is not None else self.timeout(program.commands)
+        try:
+            if self.wait_ready(timeout) != 0:
+                print(f"VXM:EXECUTE:ERROR:Program {program} not completed in {timeout:.1f} s")
+                self.commit(program.commands, False)
+                return -1
+            self.serial.write("C".encode())
+        except serial.SerialException as e:
+            print(f"VXM:EXECUTE:ERROR:Unable to execute program {program}: {e}")
+            self.commit(program.commands, False)
+            return -1
+        self.commit(program.commands)
+        print(f"VXM:EXECUTE:Executed {program} in {time.monotonic() - t:.1f} s")
+        return 0
+
+    def wait_ready(self, timeout=None):
+        # read_until returns as soon as '^' arrives, the short serial timeout
+        # only paces the deadline check
+        t = time.monotonic()
+        saved, self.serial.timeout = self.serial.timeout, VXM_POLL_TIMEOUT
+        try:
+            while b'^' not in self.serial.read_until(b'^'):
+                if timeout is not None and time.monotonic() - t > timeout:
+                    self.timeouts += 1
+                    return -1
+        finally:
+            self.serial.timeout = saved
+        self.record_latency(time.monotonic() - t)
+        return 0
+
+    def record_latency(self, dt):
+        i = 0
+        while i < len(VXM_LATENCY_BINS) and dt > VXM_LATENCY_BINS[i]:
+            i += 1
+        self.latency_hist[i] += 1
+        self.latency_count += 1
+        self.latency_sum += dt
+        self.latency_max = max(self.latency_max, dt)
+
+    def latency_stats(self):
+        labels = [f"<={edge}s" for edge in VXM_LATENCY_BINS] + [f">{VXM_LATENCY_BINS[-1]}s"]
+        return {
+            'count': self.latency_count,
+            'mean': self.latency_sum / self.latency_count if self.latency_count else 0.0,
+            'max': self.latency_max,
+            'timeouts': self.timeouts,
+            'hist': dict(zip(labels, self.latency_hist)),
+        }
+
+    def motor_speed(self, id):
+        return self.speeds.get(id, self.spdx if id == 1 else self.spdy)
+
+    def motor_travel(self, id):
+        return {1: self.lmtx, 2: self.lmty}.get(id, VXM_TRAVEL)
+
+    def model(self, positions=None):
+        # kinematic model of this controller, with the tracked positions
+        # unless given ({} for all unknown)
+        ids = range(1, 5)
+        model = VXMModel({id: self.motor_travel(id) for id in ids}, {id: self.motor_speed(id) for id in ids}, self.accs)
+        if positions is None:
+            tracked = self.tracker.load() if self.tracker is not None else {}
+            positions = {id: tracked.get(name) for id, name in self.names.items()}
+        model.pos.update(positions)
+        return model
+
+    def duration(self, commands, positions=None):
+        # expected execution time of a command sequence
+        return self.model(positions).run(commands)
+
+    def timeout(self, commands):
+        # from the worst case: every position unknown
+        return VXM_TIMEOUT_FACTOR * self.duration(commands, {}) + VXM_TIMEOUT_MARGIN
+
+    def commit(self, commands, ok=True):
+        # remember the speed/acceleration sent to the controller and follow
+        # the motor positions, a failed execution leaves its motors uncertain
+        changes = {}
+        for command in commands:
+            m = re.fullmatch(r"(S|A)(\d)M(\d+)", command)
+            if m is not None and ok:
+                (self.speeds if m.group(1) == 'S' else self.accs)[int(m.group(2))] = int(m.group(3))
+            if command == 'K':
+                changes.update({name: None for name in self.motors})
+            m = re.fullmatch(r"(IA|I)(\d)M(-?\d+)", command)
+            name = self.names.get(int(m.group(2))) if m is not None else None
+            if name is None:
+                continue
+            op, value = m.group(1), m.group(3)
+            if not ok:
+                changes[name] = None
+            elif op == 'IA':
+                changes[name] = 0 if value == '-0' else int(value)
+            elif value in ('0', '-0'):
+                # limit switch, position known only once the zero is set there
+                changes[name] = None
+            else:
+                pos = changes[name] if name in changes else self.tracker.get(name) if self.tracker else None
+                changes[name] = pos + int(value) if pos is not None else None
+        if changes and self.tracker is not None:
+            self.tracker.update(changes)
+
+    def read_position(self, id):
+        # X, Y, Z, T report the absolute position of motors 1-4, e.g. "+0004470"
+        try:
+            if self.serial.is_open is False:
+                self.serial.open()
+            self.serial.reset_input_buffer()
+            self.serial.write("XYZT"[id - 1].encode())
+            ret = self.serial.read_until(b'\r')
+        except (serial.SerialException, IndexError) as e:
+            print(f"VXM:READ_POSITION:ERROR:Unable to read motor {id} position: {e}")
+            return None
+        m = re.search(rb"[-+]?\d+", ret)
+        return int(m.group()) if m else None
+
+    def check_position(self, name):
+        # tracked position confirmed by the controller readback, None when
+        # the motor has to be homed
+        if self.tracker is None:
+            return None
+        pos = self.tracker.get(name)
+        if pos is None:
+            return None
+        readback = self.read_position(self.motors[name].id)
+        if readback != pos:
+            print(f"VXM:CHECK_POSITION:ERROR:{name} tracked at {pos}, controller reports {readback}")
+            self.tracker.update({name: None})
+            return None
+        return pos
+
+    class Program:
+
+        # sequence of S, A, I, IA, P, B0 commands for the motors of one
+        # controller, built with chained calls and executed by VXM.execute.
+        # Motors are given by name, Motor object or index
+
+        def __init__(self, vxm):
+            self.vxm = vxm
+            self.commands = []
+
+        def motor_id(self, motor):
+            if isinstance(motor, str):
+                motor = self.vxm.get_motor(motor)
+            if isinstance(motor, VXM.Motor):
+                if motor.serial is not self.vxm.serial:
+                    raise ValueError(f"motor {motor.id} is not connected to {self.vxm.port}")
+                return motor.id
+            return int(motor)
+
+        def add(self, command):
+            self.commands.append(command)
+            return self
+
+        def speed(self, motor, value):
+            return self.add(f"S{self.motor_id(motor)}M{int(value)}")
+
+        def acc(self, motor, value):
+            return self.add(f"A{self.motor_id(motor)}M{int(value)}")
+
+        def move(self, motor, steps):
+            return self.add(f"I{self.motor_id(motor)}M{int(steps)}")
+
+        def move_abs(self, motor, pos):
+            return self.add(f"IA{self.motor_id(motor)}M{int(pos)}")
+
+        def limit(self, motor, negative=True):
+            # run to the negative (-0) or positive (0) limit switch
+            return self.add(f"I{self.motor_id(motor)}M{'-' if negative else ''}0")
+
+        def set_zero(self, motor):
+            return self.add(f"IA{self.motor_id(motor)}M-0")
+
+        def wait(self, dtime):
+            # P unit is 0.1 s
+            return self.add(f"P{int(round(dtime * 10))}")
+
+        def backlash_off(self):
+            return self.add("B0")
+
+        def home(self, motor, force=False):
+            # negative limit (twice) and absolute zero there, only when the
+            # position is uncertain
+            id = self.motor_id(motor)
+            if force or self.vxm.check_position(self.vxm.names.get(id)) is None:
+                self.limit(id).limit(id).set_zero(id)
+            return self
+
+        def compile(self):
+            return ",".join(self.commands)
+
+        def duration(self):
+            return self.vxm.duration(self.commands)
+
+        def execute(self, timeout=None):
+            return self.vxm.execute(self, timeout)
+
+        def __str__(self):
+            return self.compile()
+
     class Motor:
 
-        def __init__(self, serial, id):
+        def __init__(self, serial, id, vxm=None):
             self.serial = serial
             self.id = id
+            self.vxm = vxm
             self.string_return = 255
 
         def check_open(func):
@@ -73,9 +401,12 @@ class VXM:
             # disable echo
             self.serial.write("F".encode())
             # disable backlash compensation
-            self.send_command("B0".encode())
+            self.send_command("B0")
             time.sleep(0.5)
             
+        def home(self, force=False):
+            return self.vxm.program().home(self, force).execute()
+
         def is_connected(self):
             self.send_command("E")
             self.send_command("C")
@@ -107,17 +438,14 @@ class VXM:
                 print(f"VXM:READ_R:ERROR:Unable to read response")
                 return -1
 
-        def run(self):
+        def run(self, timeout=None):
             self.flush_buffers()
             self.serial.write("R\r".encode())
 
-            ready = ""
             try:
-                while ready != "^":
-                    time.sleep(0.5)
-                    response = self.serial.read(self.string_return).decode(errors='ignore').strip()
-                    ready = str(response)
-
+                if self.vxm.wait_ready(timeout) != 0:
+                    print(f"VXM:RUN:ERROR:VXM at {self.serial.port}:Not completed in {timeout:.1f} s")
+                    return -1
                 print(f"VXM:RUN:Executed")
                 return 0
             except Exception as e:
@@ -130,21 +458,24 @@ class VXM:
                 #self.serial.flushInput()
                 self.flush_buffers()
                 self.serial.write(f"{command}\r".encode())
-                time.sleep(0.5)
+                self.serial.flush()
 
                 print(f"VXM: send command {command} to motor {self.id}")
 
                 try:
-                    response = self.run()
+                    response = self.run(self.vxm.timeout([command]))
                 except serial.SerialException: 
                     print(f"VXM:READ_R:ERROR: unable to execute command")
+                    self.vxm.commit([command], False)
                     return -1
 
                 self.serial.write("C".encode())
+                self.vxm.commit([command], response == 0)
                 return response
 
             except serial.SerialException as e:
                 print(f"VXM:SEND_COMM: unable to send {command} command: {e}")
+                self.vxm.commit([command], False)
                 return -1
             
         @check_open
@@ -152,7 +483,6 @@ class VXM:
             try:
                 self.serial.reset_input_buffer()
                 self.serial.reset_output_buffer()
-                time.sleep(0.1)
                 return 0
             except Exception as e:
                 print(f"VXM:FLUSH_BUFFERS:Unable to flush buffers: {e}")
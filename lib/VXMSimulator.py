@@ -0,0 +1,160 @@
+import os
+import re
+import sys
+import time
+import argparse
+import threading
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.PtySimulator import PtySimulator
+from lib.VXM import VXM, VXMModel, VXM_DEFAULT_ACC, move_position
+
+# program commands, complete once a separator follows
+VXMSIM_COMMAND = re.compile(rb"((?:IA|I|S|A)\d+M-?\d+|P\d+|B\d+|setM\d+M\d+)[,\r\n ]")
+VXMSIM_SEPARATORS = b",\r\n "
+VXMSIM_SEPARATOR = re.compile(rb"[,\r\n ]")
+# commands executed on reception
+VXMSIM_IMMEDIATE = b"CFEVKRQNXYZT"
+
+class VXMSimulator(PtySimulator):
+
+    # VXM controller stand-in: program commands (S, A, I, IA, P, B0, setM) are
+    # stored and executed on R with the VXMModel trapezoidal kinematics in
+    # real time (divided by speedup), then '^' is sent. C clears the program,
+    # V answers R (ready) or B (busy), K stops the motion where it is, X/Y/Z/T
+    # report the absolute positions, E/F turn the echo on/off. At power on
+    # motors 1-2 stand at POSX/POSY steps from their negative limit switch,
+    # motors 3-4 on it, limits as in VXM.motor_travel
+
+    def __init__(self, link=None, speedup=1.0):
+        super().__init__(link=link)
+        ref = VXM(None)
+        self.speedup = speedup
+        self.model = VXMModel({id: ref.motor_travel(id) for id in range(1, 5)},
+            {id: ref.motor_speed(id) for id in range(1, 5)})
+        for id in range(1, 5):
+            self.model.pos[id] = 0
+            self.model.lo[id] = -{1: ref.POSX, 2: ref.POSY}.get(id, 0)
+        self.program = []
+        self.echo = False
+        self.motion = None
+        self.killed = threading.Event()
+        self.mutex = threading.Lock()
+        self.runner = None
+        self.counters = {'programs': 0, 'commands': 0, 'kills': 0}
+
+    def stop(self):
+        self.killed.set()
+        with self.mutex:
+            runner = self.runner
+        if runner is not None:
+            runner.join()
+        super().stop()
+
+    def stats(self):
+        return dict(self.counters)
+
+    def busy(self):
+        with self.mutex:
+            runner = self.runner
+        return runner is not None and runner.is_alive()
+
+    def position(self, id):
+        # interpolated during a move
+        with self.mutex:
+            if self.motion is not None and self.motion[0] == id:
+                id, start, end, t0 = self.motion
+                t = (time.monotonic() - t0) * self.speedup
+                step = move_position(end - start, self.model.speed[id], self.model.acc.get(id, VXM_DEFAULT_ACC), t)
+                return int(round(start + step if end >= start else start - step))
+            return self.model.pos[id]
+
+    def handle_bytes(self, data):
+        if self.echo:
+            self.write(data)
+        self.buffer += data
+        while self.buffer:
+            c = self.buffer[:1]
+            if c in VXMSIM_SEPARATORS:
+                self.buffer = self.buffer[1:]
+                continue
+            m = VXMSIM_COMMAND.match(self.buffer)
+            if m is not None:
+                self.buffer = self.buffer[m.end():]
+                if not self.busy():
+                    self.program.append(m.group(1).decode())
+                continue
+            if c in VXMSIM_IMMEDIATE:
+                self.buffer = self.buffer[1:]
+                self.immediate(c.decode())
+                continue
+            m = VXMSIM_SEPARATOR.search(self.buffer)
+            if m is None:
+                # incomplete command
+                break
+            # unknown command, skip it
+            self.buffer = self.buffer[m.end():]
+
+    def immediate(self, c):
+        if c == 'C' and not self.busy():
+            self.program = []
+        elif c == 'F':
+            self.echo = False
+        elif c == 'E':
+            self.echo = True
+        elif c == 'V':
+            self.write("B" if self.busy() else "R")
+        elif c == 'K':
+            self.counters['kills'] += 1
+            self.killed.set()
+        elif c == 'R' and not self.busy():
+            self.killed.clear()
+            runner = threading.Thread(target=self.execute, args=(list(self.program),), daemon=True)
+            with self.mutex:
+                self.runner = runner
+            runner.start()
+        elif c in 'XYZT':
+            self.write(f"{self.position('XYZT'.index(c) + 1):+08d}\r")
+
+    def execute(self, program):
+        self.counters['programs'] += 1
+        for command in program:
+            self.counters['commands'] += 1
+            if command.startswith('B') or command.startswith('setM'):
+                # backlash and motor type, no motion
+                continue
+            with self.mutex:
+                id, start, end, duration = self.model.execute(command)
+                if id is not None and duration > 0:
+                    self.motion = (id, start, end, time.monotonic())
+            killed = self.killed.wait(duration / self.speedup)
+            if killed:
+                if id is not None and duration > 0:
+                    pos = self.position(id)
+                    with self.mutex:
+                        self.model.pos[id] = pos
+                        self.model.at_lo.discard(id)
+                with self.mutex:
+                    self.motion = None
+                return
+            with self.mutex:
+                self.motion = None
+        # ready before '^', a program sent right after it must be accepted
+        with self.mutex:
+            self.runner = None
+        self.write("^")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='VXM motor controller simulator')
+    parser.add_argument('--link', default=None, help='symlink for the pty (e.g. /tmp/ttyr03)')
+    parser.add_argument('--speedup', type=float, default=1.0, help='time compression factor for the motion')
+    args = parser.parse_args()
+
+    sim = VXMSimulator(args.link, args.speedup).start()
+    print(f"VXM: {sim.port}")
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        sim.stop()
+        print(sim.stats())
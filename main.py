@@ -8,6 +8,7 @@ import cmd2
 from datetime import datetime, timedelta
 from lib.Configuration import Configuration
 from lib.DeviceCollection import DeviceCollection
+from lib.LaserTelemetry import LaserTelemetry
 from lib.HouseKeeping import HouseKeeping
 from lib.RunManager import RunManager
 from lib.RunCalendar import RunEntry
@@ -26,6 +27,7 @@ class App(cmd2.Cmd):
 
         self.dc = DeviceCollection()
         self.dc.init(self.cfg)
+        self.dc.telemetry.start()
 
         #Logger.init()
 
@@ -127,6 +129,7 @@ class App(cmd2.Cmd):
         """get system info"""
         print(f"mode: {self.mode}")
         print(f'scheduler status: {self.rm.print_status()}')
+        print(f'trigger timing: {self.rm.timing_status()}')
         print(f'next run for auto mode: {self.rm.next_run()}')
 
     ## calendar ##
@@ -212,6 +215,68 @@ class App(cmd2.Cmd):
         else:
             self.do_help("pdu")
 
+    ## fpga ##
+
+    fpga_parser = cmd2.Cmd2ArgumentParser()
+    fpga_subparser = fpga_parser.add_subparsers(title='subcommands')
+
+    fpga_cache_parser = fpga_subparser.add_parser("cache", help='show register cache hit/miss counters')
+    fpga_invalidate_parser = fpga_subparser.add_parser("invalidate", help='invalidate register cache after FPGA reset or power cycle')
+
+    def fpgacache(self, args):
+        stats = self.dc.fpga.cache_stats()
+        print(f"hits: {stats['hits']}, misses: {stats['misses']}")
+
+    def fpgainvalidate(self, args):
+        self.dc.fpga.invalidate_cache()
+        print("register cache invalidated")
+
+    fpga_cache_parser.set_defaults(func=fpgacache)
+    fpga_invalidate_parser.set_defaults(func=fpgainvalidate)
+
+    @cmd2.with_argparser(fpga_parser)
+    def do_fpga(self, args):
+        """manage FPGA register cache"""
+        func = getattr(args, 'func', None)
+        if func is not None:
+            func(self, args)
+        else:
+            self.do_help("fpga")
+
+    ## laser ##
+
+    laser_parser = cmd2.Cmd2ArgumentParser()
+    laser_subparser = laser_parser.add_subparsers(title='subcommands')
+
+    laser_telemetry_parser = laser_subparser.add_parser("telemetry", help='show the last laser telemetry sample')
+
+    def lasertelemetry(self, args):
+        stats = self.dc.telemetry.stats()
+        sample = self.dc.telemetry.latest()
+        if sample is None:
+            print(f"no recent sample - samples: {stats['samples']}, errors: {stats['errors']}")
+            return
+        def value(name, fmt='d'):
+            # fields whose reply was missing are NaN
+            v = LaserTelemetry.field(sample, name)
+            return 'n/a' if v is None else format(v, fmt)
+
+        print(f"status: {value('state', '#04x')}, temps (head, dump, plate): "
+            f"{value('head_temp')}, {value('dump_temp')}, {value('plate_temp')}")
+        print(f"shots: {value('shots')}, user shots: {value('user_shots')}")
+        print(f"age: {stats['age']:.1f} s, samples: {stats['samples']}, errors: {stats['errors']}")
+
+    laser_telemetry_parser.set_defaults(func=lasertelemetry)
+
+    @cmd2.with_argparser(laser_parser)
+    def do_laser(self, args):
+        """show laser telemetry"""
+        func = getattr(args, 'func', None)
+        if func is not None:
+            func(self, args)
+        else:
+            self.do_help("laser")
+
     ## quit ##
 
     def do_quit(self, _):
@@ -221,6 +286,7 @@ class App(cmd2.Cmd):
             return
         self.hk.close()
         self.thr_hk.join()
+        self.dc.telemetry.stop()
         self.rm.close()
         print("Bye!")
         sys.exit(0)
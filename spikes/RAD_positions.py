@@ -34,40 +34,20 @@ if __name__ == "__main__":
 
     time.sleep(1)
 
-    # motor
-    dc.get_motor("UpEastWest").init()  
-    dc.get_motor("UpEastWest").move_Neg0()  
-    dc.get_motor("UpEastWest").move_Neg0()  
-
-    dc.get_motor("UpEastWest").set_ABSzero()
-    # dc.get_motor("UpEastWest").move_ABS(4470) # CLF
-    dc.get_motor("UpEastWest").move_ABS(8500) # XLF
-
-    # motor
-    dc.get_motor("UpNorthSouth").init()  
-    dc.get_motor("UpNorthSouth").move_Neg0()  
-    dc.get_motor("UpNorthSouth").move_Neg0()  
-
-    dc.get_motor("UpNorthSouth").set_ABSzero()
-    # dc.get_motor("UpNorthSouth").move_ABS(33250)  # CLF
-    dc.get_motor("UpNorthSouth").move_ABS(34250)  # XLF
-
-    # motor
-    dc.get_motor("LwNorthSouth").init()  
-    dc.get_motor("LwNorthSouth").move_Neg0()  
-    dc.get_motor("LwNorthSouth").move_Neg0()  
-
-    dc.get_motor("LwNorthSouth").set_ABSzero()
-    # dc.get_motor("LwNorthSouth").move_ABS(18900)  # CLF
-    dc.get_motor("LwNorthSouth").move_ABS(18900)  # XLF
-
-    # motor
-    dc.get_motor("LwPolarizer").init()  
-    dc.get_motor("LwPolarizer").move_Neg0()  
-    dc.get_motor("LwPolarizer").move_Neg0()  
-
-    dc.get_motor("LwPolarizer").set_ABSzero()
-    dc.get_motor("LwPolarizer").move_ABS(90 * 80)
+    # the four motors share one VXM: home (only if the tracked position is
+    # uncertain) and position them with a single program
+    dc.get_motor("UpEastWest").init()
+    program = dc.get_motor("UpEastWest").vxm.program()
+
+    positions = {
+        "UpEastWest": 8500,         # CLF 4470
+        "UpNorthSouth": 34250,      # CLF 33250
+        "LwNorthSouth": 18900,      # CLF 18900
+        "LwPolarizer": 90 * 80,
+    }
+    for name, pos in positions.items():
+        program.home(name).move_abs(name, pos)
+    program.execute()
 
     # motor
     # command to open (Neg0 = open)
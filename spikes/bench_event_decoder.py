@@ -0,0 +1,70 @@
+import sys
+import os
+import time
+import random
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGAData import EventFramer, decode_packets
+
+# throughput of the FPGA event decoders: per packet split/int (old read_event
+# and Data_Receiver.py), streaming EventFramer and vectorized decode_packets
+
+def make_stream(npackets):
+    packets = []
+    for n in range(npackets):
+        seconds = 1_700_000_000 + n // 100
+        counter = 34982 + random.randint(-5, 5)
+        fields = [seconds >> 16, seconds & 0xFFFF, counter >> 16, counter & 0xFFFF, 32767 + random.randint(-5, 5), (n + 1) & 0xFFFF]
+        packets.append("BAAB\r" + "".join(f"{value:04X}\r" for value in fields) + "FEEF\r")
+    return "".join(packets).encode()
+
+def decode_split(stream):
+    # walks an index, the per packet cost of read_event without copying the
+    # rest of the buffer for every packet
+    events = []
+    pos = 0
+    while True:
+        start_idx = stream.find(b'BAAB', pos)
+        if start_idx == -1 or len(stream) < start_idx + 40:
+            break
+        packet = stream[start_idx:start_idx + 40]
+        pos = start_idx + 40
+        if packet[-5:-1] == b'FEEF':
+            values = packet[5:-5].decode().split('\r')[:-1]
+            seconds = (int(values[0], 16) << 16) + int(values[1], 16)
+            counter = ((int(values[2], 16) << 16) | int(values[3], 16)) * 10
+            pps_delta = (int(values[4], 16) - 32767) * 10
+            events.append((seconds, counter, pps_delta, int(values[5], 16)))
+    return len(events)
+
+def decode_framer(stream):
+    framer = EventFramer()
+    events = []
+    for i in range(0, len(stream), 4096):
+        framer.feed(stream[i:i+4096])
+        framer.decode(events)
+    return len(events)
+
+def decode_numpy(stream):
+    events, _ = decode_packets(stream)
+    return events.shape[1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='FPGA event decoder benchmark')
+    parser.add_argument('--packets', type=int, default=75_000, help='synthetic packets (a full Raman run)')
+    parser.add_argument('--file', default=None, help='captured /dev/data0 stream instead of synthetic data')
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, 'rb') as f:
+            stream = f.read()
+    else:
+        stream = make_stream(args.packets)
+    print(f"{len(stream)} bytes")
+
+    for name, func in [('split/int', decode_split), ('EventFramer', decode_framer), ('decode_packets', decode_numpy)]:
+        t = time.perf_counter()
+        n = func(stream)
+        dt = time.perf_counter() - t
+        print(f"{name:15s} {n} packets in {dt:.3f} s, {n / dt:,.0f} packets/s, {len(stream) / dt / 1e6:.1f} MB/s")
@@ -0,0 +1,32 @@
+import sys
+import os
+import argparse
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.Configuration import Configuration
+from lib.DeviceCollection import DeviceCollection
+from lib.MotorPlanner import MotorPlanner
+
+# visit the ecal/pcal positions of motors.yml in the fastest order, motors on
+# different VXM controllers move concurrently
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='calibration positions')
+    parser.add_argument('--keys', nargs='+', default=['ecal_position', 'pcal_position'], help='motors.yml position keys')
+    parser.add_argument('--dry-run', action='store_true', help='print the plan and the estimated duration only')
+    args = parser.parse_args()
+
+    cfg = Configuration()
+    cfg.read()
+
+    dc = DeviceCollection()
+    dc.init(cfg)
+
+    planner = dc.get_planner()
+    stations = MotorPlanner.calib_stations(cfg, args.keys)
+    ordered, duration = planner.plan(stations)
+    for station in ordered:
+        print(station)
+    print(f"estimated motion time {duration:.1f} s")
+
+    if not args.dry_run:
+        planner.execute(stations, at=lambda station: input(f"at {station}, press enter to continue"))
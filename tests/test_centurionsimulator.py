@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import serial
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.CenturionSimulator import CenturionSimulator, CENTSIM_FIRING
+from lib.Centurion import Centurion
+from lib.LaserTelemetry import LaserTelemetry
+
+speedup = 20
+
+sim = CenturionSimulator(speedup=speedup, warmup=60, rate=100).start()
+print(f"Centurion: {sim.port}")
+# a pty does not support even parity
+laser = Centurion(sim.port, parity=serial.PARITY_NONE)
+telemetry = LaserTelemetry(laser, 0.1, path="/tmp/test_centurionsimulator.csv").start()
+
+print("1. communication and cold setup")
+print("comm test", laser.comm_test())
+t = time.monotonic()
+print("set_mode (cold laser, no fire auth)", laser.apply_profile('raman'), f"{time.monotonic() - t:.3f} s", laser.session_stats())
+print(laser.parameters())
+
+print("2. warmup and wait for fire auth")
+laser.warmup()
+t = time.monotonic()
+while not telemetry.fire_auth():
+    time.sleep(0.05)
+print(f"fire auth after {(time.monotonic() - t) * speedup:.1f} s simulated, temps {telemetry.temperature()}")
+t = time.monotonic()
+print("set_mode (warm laser)", laser.apply_profile('raman'), f"{time.monotonic() - t:.3f} s", laser.session_stats())
+
+print("3. fire 60 s simulated, then standby 60 s")
+laser.warmup()
+telemetry.fire()
+time.sleep(60 / speedup)
+print("firing", sim.stats(), telemetry.latest())
+laser.standby()
+time.sleep(60 / speedup)
+print("standby", sim.stats())
+
+print("4. overheating interlock at 300 Hz")
+sim.rate = 300
+laser.warmup()
+telemetry.fire()
+t = time.monotonic()
+time.sleep(0.2)
+while telemetry.latest()['state'] == CENTSIM_FIRING:
+    time.sleep(0.05)
+print(f"interlock after {(time.monotonic() - t) * speedup:.1f} s simulated", sim.stats())
+
+print("5. unnoticed power cycle, the readback detects it")
+sim.power_cycle()
+print("set_mode", laser.apply_profile('raman'), laser.session_stats())
+print(laser.parameters(), sim.params)
+
+telemetry.stop()
+print(telemetry.stats())
+print(laser.latency_stats())
+sim.stop()
+os.unlink("/tmp/test_centurionsimulator.csv")
@@ -29,6 +29,12 @@ fp.write_register('pulse_period', 3_000_000_000)
 print("4.2 read pulse period (32bit)")
 print(hex(fp.read_register("pulse_period")))
 
+print("4.3 burst write run profile with readback verify")
+print(fp.write_registers({'pulse_width': 10_000, 'pulse_period': 100_000_000, 'shots_num': 50, 'mux_bnc_0': 0b0010}))
+
+print("4.4 burst read run profile")
+print(fp.read_registers(['pulse_width', 'pulse_period', 'shots_num', 'mux_bnc_0']))
+
 print("5. read DIO rain")
 print(fp.read_dio("rain"))
 
@@ -53,6 +59,12 @@ print(fp.read_bit("pps_ok"))
 print("11. turn off DIO inverter")
 fp.write_dio("inverter", 0)
 
+print("12. register cache counters")
+print(fp.cache_stats())
+fp.invalidate_cache()
+print(fp.read_register("pulse_width"))
+print(fp.cache_stats())
+
 """
 print("test mutual exclusion")
 
@@ -87,4 +99,4 @@ thr2.join()
 print("- end thread #2")
 """
 
-fp.close()
+fp.shutdown()
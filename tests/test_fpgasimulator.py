@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.FPGASimulator import FPGASimulator
+from lib.FPGADevice import FPGADevice
+from lib.FPGAData import FPGAData
+from lib.FPGABroker import FPGA_READ_RETRIES
+
+nshots = 50
+speedup = 20
+
+sim = FPGASimulator(speedup=speedup).start()
+print(f"runcontrol: {sim.port}, data: {sim.data.port}")
+
+fp = FPGADevice(sim.port)
+data = FPGAData(sim.data.port)
+
+print("1. apply FD register profile")
+t = time.time()
+print(fp.write_registers({
+    'pps_delay': 34982,
+    'pulse_width': 10_000,
+    'pulse_energy': 17_400,
+    'pulse_period': 100_000_000,
+    'shots_num': nshots,
+    'mux_bnc_0': 0b0010,
+}))
+print(f"done in {time.time() - t:.3f} s")
+
+print("2. read DIO status")
+for name in ['pps_ok', 'cover_raman_closed', 'cover_raman_open', 'rain', 'norain', 'inverter']:
+    print(name, fp.read_dio(name))
+
+print(f"3. fire {nshots} shots at {speedup}x and read events")
+fp.write_dio('timestamp_en', 1)
+fp.write_dio('laser_en', 1)
+t = time.time()
+fp.write_dio('laser_start', 1)
+for i in range(nshots):
+    print(i, data.read_event())
+print(f"done in {time.time() - t:.3f} s, shots_cnt: {fp.read_register('shots_cnt')}")
+print("framer counters", data.stats())
+
+print(f"4. fire {nshots} shots without timestamps and watch shots_cnt")
+fp.write_dio('timestamp_en', 0)
+t = time.monotonic()
+fp.write_dio('laser_start', 1)
+print(fp.watch('shots_cnt', lambda n: n >= nshots, 10, eta=t + nshots / speedup))
+print(f"end of shots detected after {time.monotonic() - t:.3f} s")
+
+print("5. register cache counters")
+print(fp.cache_stats())
+
+print("6. late read reply, past the broker serial timeout")
+fp.invalidate_cache()
+sim.delay_reads(1, 2.02)
+print(fp.read_registers(['pps_delay', 'pulse_width', 'pulse_period', 'shots_num']))
+print("cached", fp.read_registers(['pps_delay', 'pulse_width', 'pulse_period', 'shots_num']), fp.cache_stats())
+
+print("7. no reply after every retry")
+fp.invalidate_cache()
+sim.delay_reads(FPGA_READ_RETRIES, 2.02)
+try:
+    print(fp.read_register('pulse_width'))
+except RuntimeError as e:
+    print("RuntimeError", e)
+print("recovered", fp.read_register('pulse_width'))
+
+fp.shutdown()
+sim.stop()
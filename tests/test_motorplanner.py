@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.VXM import VXM
+from lib.PositionTracker import PositionTracker
+from lib.MotorPlanner import MotorPlanner
+
+# planning only, the VXM ports are never opened
+tracker = PositionTracker("/tmp/test_motorplanner.yml")
+calib = VXM("/dev/ttyr03")
+steering = VXM("/dev/ttyr08")
+for vxm in [calib, steering]:
+    vxm.tracker = tracker
+motors = {}
+for id, name in enumerate(["LwNorthSouth", "LwPolarizer", "UpNorthSouth", "UpEastWest"], 1):
+    motors[name] = calib.add_motor(id, name)
+motors["Azimuth"] = steering.add_motor(1, "Azimuth")
+planner = MotorPlanner(motors)
+
+print("1. calibration stations, motors not homed")
+tracker.invalidate(list(motors))
+stations = [
+    {"LwNorthSouth": 0, "UpNorthSouth": 666, "UpEastWest": 777},
+    {"LwNorthSouth": 456, "UpNorthSouth": 666, "UpEastWest": 777},
+]
+print(planner.plan(stations))
+
+print("2. same stations from known positions")
+tracker.update({"LwNorthSouth": 500, "LwPolarizer": 0, "UpNorthSouth": 600, "UpEastWest": 700})
+for station in planner.plan(stations)[0]:
+    print(station)
+print(f"hand order {planner.cost([0, 1], stations, planner.current()):.2f} s")
+
+print("3. shuffled polarizer scan with a concurrent steering move")
+random.seed(1)
+scan = MotorPlanner.scan("LwPolarizer", [i * 8 * 80 for i in range(12)])
+random.shuffle(scan)
+scan[0]["Azimuth"] = 14400
+tracker.update({"Azimuth": 0})
+ordered, duration = planner.plan(scan)
+print([station["LwPolarizer"] for station in ordered], f"{duration:.2f} s")
+print(f"given order {planner.plan(scan, keep_order=True)[1]:.2f} s")
+os.unlink("/tmp/test_motorplanner.yml")
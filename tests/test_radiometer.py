@@ -3,7 +3,8 @@
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
-from lib.Radiometer import Radiometer3700, RadiometerOphir
+import time
+from lib.Radiometer import Radiometer3700, RadiometerOphir, RadiometerReader
 
 rm1 = Radiometer3700("/dev/ttyr02")
 rm1.info()
@@ -30,3 +31,10 @@ print(f'ZZ = {rm3.get("ZZ")}')          # UNK
 print(f'BLA = {rm3.get("$BLA")}')       # UNK
 print("\n\n")
 
+# streamed energies, fire the laser while the reader is running
+reader = RadiometerReader(rm1).start()
+t = time.monotonic()
+time.sleep(10)
+print(reader.take_since(t))
+reader.stop()
+print(reader.stats())
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.RadiometerSimulator import RadiometerSimulator
+from lib.Radiometer import Radiometer3700, RadiometerOphir, RadiometerReader
+
+rate = 100
+seconds = 5
+
+print("1. 3700 info, set/get and setup")
+sim1 = RadiometerSimulator('3700', rate=rate, latency=0.03).start()
+rm1 = Radiometer3700(sim1.port)
+rm1.info()
+print(rm1.set("TG", 3), rm1.set("foo", 3))      # UNK
+print(f'TG = {rm1.get("TG")}, MUU = {rm1.get("MUU")}')
+for label in ['cold', 'warm']:
+    t = time.monotonic()
+    rm1.setup()
+    print(f"{label} setup in {time.monotonic() - t:.3f} s, {rm1.session_stats()}")
+
+print("2. Ophir info and setup")
+sim2 = RadiometerSimulator('ophir', rate=rate, latency=0.05, drop_rate=0.01, garbage_rate=0.01).start()
+rm2 = RadiometerOphir(sim2.port)
+rm2.info()
+print(f'ZZ = {rm2.get("ZZ")}')                  # UNK
+rm2.setup()
+
+print(f"3. stream {seconds} s at {rate} Hz")
+readers = [RadiometerReader(rm).start() for rm in [rm1, rm2]]
+time.sleep(seconds)
+for reader, sim in zip(readers, [sim1, sim2]):
+    reader.stop()
+    print(sim.model, sim.stats(), reader.stats())
+
+print("4. power cycle, setup sends everything again")
+sim1.power_cycle()
+rm1.invalidate()
+rm1.setup()
+print(rm1.session_stats())
+
+print("4b. unnoticed power cycle, the readback detects it")
+sim1.power_cycle()
+rm1.setup()
+print(rm1.session_stats(), sim1.settings)
+
+print("5. error injection on commands")
+sim1.error_rate = 0.5
+rm1.invalidate()
+rm1.setup()
+print(sim1.settings, rm1.session_stats())
+
+sim1.stop()
+sim2.stop()
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+import tempfile
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.ShotArchive import ShotArchive
+
+nshots = 100
+path = os.path.join(tempfile.mkdtemp(), 'fd_test.shots')
+
+print(f"1. write {nshots} shots to {path} (initial capacity 16)")
+archive = ShotArchive(path, {'runtype': 'fd', 'identity': 'test', 'profile': {'pps_delay': 34982}}, ['Rad1'], capacity=16)
+for i in range(nshots):
+    archive.append(shot=i, seconds=int(time.time()), counter=349820, pps_delta=-10,
+        counter_pulses=i + 1, host_time=time.time(), energy_Rad1=None if i % 10 == 0 else 1.2e-3)
+archive.set_meta('summary', {'shots': nshots})
+archive.close()
+print(f"file size: {os.path.getsize(path)} bytes")
+
+print("2. load")
+meta, columns = ShotArchive.load(path)
+print(meta)
+for name, values in columns.items():
+    print(name, values.dtype, len(values), values[:5])
+
+print("3. missing radiometer readings")
+print(int(sum(columns['energy_Rad1'] != columns['energy_Rad1'])))
@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import random
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.ShotAcquisition import Sample
+from lib.ShotCorrelator import ShotCorrelator
+
+# synthetic 100 Hz stream: events 50/51 lost by the FPGA link, radiometer reading 100 missing
+nshots = 300
+pulse_period = 1_000_000    # 10 ms
+t0 = 1_700_000_000
+# calibrated radiometer latency and its uncertainty (s)
+latency = {'Rad1': (0.03, 0.002)}
+
+events = []
+samples = []
+for n in range(1, nshots + 1):
+    t = t0 + n * 0.01 + 0.00035
+    if n not in (50, 51):
+        events.append(Sample(0, t + 0.002 + random.random() * 0.003, (int(t), int((t % 1) * 1e9) // 10 * 10, 0, n & 0xFFFF)))
+    if n != 100:
+        samples.append(Sample(0, t + 0.03 + random.gauss(0, 0.0005), f"{n}E-3"))
+
+def incremental(events, samples, latency):
+    corr = ShotCorrelator(pulse_period, ['Rad1'], latency=latency)
+    shots = []
+    for sample in sorted(events + samples, key=lambda s: s.wall):
+        if isinstance(sample.value, tuple):
+            corr.add_event(sample)
+        else:
+            corr.add_sample('Rad1', sample)
+        shots += corr.pop(sample.wall)
+    shots += corr.pop(final=True)
+    print(f"{len(shots)} shots, {corr.stats()}")
+    print("misattributed:", [(shot.index, shot.power('Rad1')) for shot in shots if shot.power('Rad1') not in (None, f"{shot.index + 1}E-3")])
+    print("missing events:", [shot.index for shot in shots if shot.event is None])
+    print("missing powers:", [shot.index for shot in shots if shot.power('Rad1') is None])
+
+def bulk(events, samples, latency):
+    ret = ShotCorrelator.correlate(pulse_period,
+        [e.wall for e in events], [e.value[0] for e in events], [e.value[1] for e in events],
+        {'Rad1': ([s.wall for s in samples], [float(s.value) for s in samples])}, latency=latency)
+    energies = ret['Rad1']
+    print("misattributed:", sum(abs(energy - e.value[3] * 1e-3) > 1e-9 for energy, e in zip(energies, events) if energy == energy))
+    print("unmatched:", [e.value[3] - 1 for energy, e in zip(energies, events) if energy != energy], "ambiguous:", ret['ambiguous'])
+
+print("1. incremental")
+incremental(events, samples, latency)
+
+print("2. bulk")
+bulk(events, samples, latency)
+
+print("3. first radiometer reading lost")
+incremental(events, samples[1:], latency)
+bulk(events, samples[1:], latency)
+
+print("4. no calibration, flagged ambiguous")
+incremental(events, samples, None)
+bulk(events, samples[1:], None)
@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import random
+import multiprocessing
+import numpy as np
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.TimingStats import TimingStats
+
+pps_delay = 24982000        # fd_pps_delay, 10 ns ticks
+
+print("1. FD shots accumulated by a forked process, read by the parent")
+timing = TimingStats(pps_delay, 100_000_000)
+
+def run():
+    for _ in range(50):
+        timing.update(pps_delay * 10 + random.randint(-5, 5) * 10, random.randint(-5, 5) * 10)
+
+job = multiprocessing.Process(target=run)
+job.start()
+job.join()
+print(timing.summary())
+print(timing.report())
+
+print("2. Raman batch at 100 Hz, 30 ns offset")
+timing = TimingStats(0, 1_000_000)
+counter = (np.arange(1000) % 100) * 10_000_000 + 30 + np.random.randint(-2, 3, 1000) * 10
+timing.update(counter, np.zeros(1000))
+print(timing.summary())
+
+print("3. drift")
+timing = TimingStats(pps_delay, 100_000_000)
+timing.update(np.full(10, pps_delay * 10 + 500), np.zeros(10))
+print(timing.summary())
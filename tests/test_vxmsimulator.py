@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib.VXMSimulator import VXMSimulator
+from lib.VXM import VXM
+from lib.PositionTracker import PositionTracker
+
+speedup = 10
+
+sim = VXMSimulator(speedup=speedup).start()
+print(f"VXM: {sim.port}")
+vxm = VXM(sim.port, timeout=0.2)
+vxm.tracker = PositionTracker("/tmp/test_vxmsimulator.yml")
+vxm.tracker.invalidate()
+motor = vxm.add_motor(3, "UpNorthSouth")
+vxm.add_motor(4, "UpEastWest")
+motor.init()
+
+print("1. home and position two motors with one program")
+program = vxm.program().home("UpNorthSouth").move_abs("UpNorthSouth", 33250).home("UpEastWest").move_abs("UpEastWest", 4470)
+print(program)
+t = time.monotonic()
+print(program.execute())
+print(f"done in {(time.monotonic() - t) * speedup:.1f} s simulated, estimated worst case {program.duration():.1f} s")
+print("readback", vxm.read_position(3), vxm.read_position(4), "tracked", vxm.tracker.load())
+
+print("2. second positioning, homing skipped")
+program = vxm.program().home("UpNorthSouth").move_abs("UpNorthSouth", 1300).home("UpEastWest").move_abs("UpEastWest", 20200)
+estimate = program.duration()
+t = time.monotonic()
+print(program, program.execute())
+print(f"done in {(time.monotonic() - t) * speedup:.2f} s simulated, estimated {estimate:.2f} s")
+
+print("3. single commands")
+print(motor.set_speed(2000), motor.move_FWD(1000), vxm.read_position(3))
+
+print("4. kill during a move")
+vxm.serial.write(b"C,I3M20000,R")
+time.sleep(0.2)
+print("moving", vxm.read_position(3))
+vxm.serial.write(b"K")
+time.sleep(0.1)
+print("stopped", vxm.read_position(3), sim.stats())
+
+print(vxm.latency_stats())
+sim.stop()
+os.unlink("/tmp/test_vxmsimulator.yml")